@@ -1,13 +1,11 @@
 
-import os
 import time
-import queue
 
 import streamlit as st
 from dotenv import load_dotenv
 from streamlit_autorefresh import st_autorefresh
 
-from email_worker import start_worker, stop_worker
+from worker_client import WorkerUnavailable, get_worker_client
 
 # ------------------------------------
 # Load environment variables
@@ -26,69 +24,21 @@ st.set_page_config(
 # ------------------------------------
 # SESSION STATE INITIALIZATION
 # ------------------------------------
-if "automation_running" not in st.session_state:
-    st.session_state.automation_running = False
-
 if "logs" not in st.session_state:
     st.session_state.logs = []
 
-# IMPORTANT:
-# We create a Queue ONCE and then capture it in the logger closure.
-# The worker thread ONLY talks to this queue (no Streamlit APIs!)
-if "log_queue" not in st.session_state:
-    st.session_state.log_queue = queue.Queue()
+# Sequence number of the last worker log line already pulled
+if "log_seq" not in st.session_state:
+    st.session_state.log_seq = 0
 
-log_queue: queue.Queue = st.session_state.log_queue
+# The worker runs in its own process (worker_daemon.py); this page only
+# talks to its HTTP API, so reloading the UI never touches ticket handling.
+worker_api = get_worker_client()
 
 
-# ------------------------------------
-# THREAD-SAFE LOGGER (NO st.* INSIDE)
-# ------------------------------------
 def logger(message: str):
-    """
-    This function is passed to email_worker.start_worker(...).
-
-    It is called from the BACKGROUND worker thread, so it MUST NOT
-    use any Streamlit APIs (no st.session_state, no st.* at all).
-
-    We only push messages into a plain Python queue, which is safe.
-    """
-    try:
-        log_queue.put(str(message).strip())
-    except Exception as e:
-        # As a last resort, print to console
-        print("[LOGGER ERROR]", e, "while logging:", message)
-
-
-# ------------------------------------
-# HELPER FUNCTIONS
-# ------------------------------------
-def save_uploaded_file(uploaded_file, filename):
-    if uploaded_file:
-        with open(filename, "wb") as f:
-            f.write(uploaded_file.getvalue())
-        return True
-    return False
-
-
-def update_env_file(gemini_key: str):
-    env_data = {}
-
-    if os.path.exists(".env"):
-        with open(".env", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#") or "=" not in line:
-                    continue
-                k, v = line.split("=", 1)
-                env_data[k.strip()] = v.strip()
-
-    if gemini_key:
-        env_data["GEMINI_API_KEY"] = gemini_key
-
-    with open(".env", "w") as f:
-        for k, v in env_data.items():
-            f.write(f"{k}={v}\n")
+    """UI-side log line (the worker's own lines come from /logs)."""
+    st.session_state.logs.append(str(message).strip())
 
 
 # ------------------------------------
@@ -108,6 +58,13 @@ st.markdown(
 
 st.markdown("---")
 
+try:
+    worker = worker_api.status()
+except WorkerUnavailable as e:
+    st.error(f"🛰️ {e}")
+    st.info("Start the worker process first: `python worker_daemon.py` (or the systemd / compose service).")
+    st.stop()
+
 # ------------------------------------
 # CONFIGURATION PANEL
 # ------------------------------------
@@ -139,7 +96,7 @@ st.markdown(
     """
     <div style='padding:10px; margin-top:10px; border-radius:8px;
                 background-color:#1A1D23; color:#E2E8F0;'>
-        ℹ️ <strong>Note:</strong> Your Gemini API key will be stored securely in <code>.env</code>.
+        ℹ️ <strong>Note:</strong> Your Gemini API key will be stored securely in the worker's <code>.env</code>.
     </div>
     """,
     unsafe_allow_html=True
@@ -157,40 +114,37 @@ token_read = st.file_uploader("token_read.json", type=["json"])
 token_send = st.file_uploader("token_send.json", type=["json"])
 error_db = st.file_uploader("possible_error.json", type=["json"])
 
+kb_file = st.file_uploader(
+    f"{worker['knowledge_base_file']} (optional - hot-reloads the knowledge base)", type=["json", "kbc"]
+)
+
 if st.button("💾 Save All Files"):
     ok = True
 
-    if cred_file:
-        save_uploaded_file(cred_file, "credentials.json")
-        logger("Saved credentials.json")
-    else:
-        ok = False
-        st.warning("Missing: credentials.json")
-
-    if token_read:
-        save_uploaded_file(token_read, "token_read.json")
-        logger("Saved token_read.json")
-    else:
-        ok = False
-        st.warning("Missing: token_read.json")
-
-    if token_send:
-        save_uploaded_file(token_send, "token_send.json")
-        logger("Saved token_send.json")
-    else:
-        ok = False
-        st.warning("Missing: token_send.json")
-
-    if error_db:
-        save_uploaded_file(error_db, "possible_error.json")
-        logger("Saved possible_error.json")
-    else:
-        ok = False
-        st.warning("Missing: possible_error.json")
-
-    if gemini_key:
-        update_env_file(gemini_key)
-        logger("GEMINI_API_KEY updated.")
+    for uploaded, name in (
+        (cred_file, "credentials.json"),
+        (token_read, "token_read.json"),
+        (token_send, "token_send.json"),
+        (error_db, "possible_error.json"),
+    ):
+        if not uploaded:
+            ok = False
+            st.warning(f"Missing: {name}")
+            continue
+        result = worker_api.upload(name, uploaded.getvalue())
+        if result.get("saved"):
+            logger(f"Saved {name}")
+        else:
+            ok = False
+            st.warning(result.get("error", f"Could not save {name}"))
+
+    if kb_file:
+        result = worker_api.upload(worker["knowledge_base_file"], kb_file.getvalue())
+        if result.get("saved"):
+            logger(f"Saved {worker['knowledge_base_file']} - index rebuilds in the background")
+        else:
+            ok = False
+            st.warning(result.get("error", "Could not save the knowledge base"))
 
     if ok:
         st.success("All files saved successfully 🎉")
@@ -216,40 +170,24 @@ with c2:
 if start_btn:
     if not gmail_id:
         st.warning("Enter Gmail ID.")
-    elif not gemini_key and "GEMINI_API_KEY" not in os.environ:
+    elif not gemini_key and not worker["gemini_key_set"]:
         st.warning("Enter Gemini API Key.")
-    elif not os.path.exists("credentials.json"):
-        st.warning("Upload credentials.json.")
-    elif not os.path.exists("token_read.json"):
-        st.warning("Upload token_read.json.")
-    elif not os.path.exists("token_send.json"):
-        st.warning("Upload token_send.json.")
-    elif not os.path.exists("possible_error.json"):
-        st.warning("Upload possible_error.json.")
     else:
-        # Persist key if provided
-        if gemini_key:
-            update_env_file(gemini_key)
-            logger("GEMINI_API_KEY updated in .env")
-
-        os.environ["AUTOMATION_GMAIL"] = gmail_id
-
-        # Start background worker
-        start_worker(
-            poll_interval=int(poll_interval),
-            logger=logger
-        )
-
-        st.session_state.automation_running = True
-        st.success("Automation Running 🚀")
-        logger("✅ Automation started from UI")
+        # Files and key are checked again by the worker before it starts
+        result = worker_api.start(int(poll_interval), gmail=gmail_id, gemini_key=gemini_key or None)
+        if result.get("error"):
+            st.warning(result["error"])
+        elif result["started"]:
+            st.success("Automation Running 🚀")
+            logger("✅ Automation started from UI")
+        else:
+            st.info("Automation is already running (started from another session).")
 
 # ---------- STOP ----------
 if stop_btn:
-    stop_worker()
-    st.session_state.automation_running = False
-    st.error("Automation Stopped ⛔")
-    logger("❌ Automation stopped from UI")
+    if worker_api.stop()["stopped"]:
+        st.error("Automation Stopping ⛔ - queued tickets are drained first")
+        logger("❌ Automation stopped from UI")
 
 st.markdown("---")
 
@@ -258,40 +196,170 @@ st.markdown("---")
 # ------------------------------------
 st.subheader("📊 System Status & Live Logs")
 
+worker = worker_api.status()
+metrics = worker_api.metrics()
+
 status_col1, status_col2, status_col3 = st.columns([2, 1, 1])
 
 with status_col1:
-    status = (
-        "<span style='color:#4ADE80;'>🟢 Running</span>"
-        if st.session_state.automation_running
-        else "<span style='color:#F87171;'>🔴 Stopped</span>"
-    )
+    if worker["stopping"]:
+        status = "<span style='color:#FBBF24;'>🟡 Stopping</span>"
+    elif worker["running"]:
+        status = "<span style='color:#4ADE80;'>🟢 Running</span>"
+    else:
+        status = "<span style='color:#F87171;'>🔴 Stopped</span>"
     st.markdown(f"### Status: {status}", unsafe_allow_html=True)
 
 with status_col2:
-    # Show current queue size
-    queue_size = log_queue.qsize()
-    st.metric("Pending Log Queue", queue_size)
+    st.metric("Emails Seen", worker["seen"])
 
 with status_col3:
     if st.button("🔄 Manual Refresh", use_container_width=True):
         st.experimental_rerun()
 
+# ------------------------------------
+# PIPELINE READINESS (warm-up)
+# ------------------------------------
+readiness = metrics["readiness"]
+if readiness:
+    st.markdown("#### 🔥 Pipeline Readiness")
+    ready_cols = st.columns(len(readiness))
+    for col, (name, info) in zip(ready_cols, readiness.items()):
+        icon = {"ready": "🟢", "loading": "🟡", "pending": "⚪", "failed": "🔴"}.get(info["state"], "⚪")
+        with col:
+            st.metric(f"{icon} {name.replace('_', ' ')}", info["state"])
+            if info.get("optional"):
+                st.caption("optional - not waited for")
+            if info["seconds"] is not None:
+                st.caption(f"{info['seconds']:.1f}s")
+            if info["error"]:
+                st.caption(f"error: {info['error'][:120]}")
+
+# ------------------------------------
+# KNOWLEDGE BASE (hot reload)
+# ------------------------------------
+kb = metrics.get("knowledge_base")
+if kb:
+    st.markdown("#### 📚 Knowledge Base")
+    k1, k2, k3 = st.columns(3)
+    k1.metric("Version", kb["version"] or "-")
+    k2.metric("Issues", kb["issues"])
+    k3.metric("State", "🟡 rebuilding" if kb["reloading"] else "🟢 live")
+    st.caption(
+        f"loaded {time.strftime('%H:%M:%S', time.localtime(kb['loaded_at']))} · reloads {kb['reloads']}"
+        if kb["loaded_at"] else "not loaded yet"
+    )
+    if kb["last_error"]:
+        st.caption(f"last reload skipped: {kb['last_error'][:120]}")
+
+# ------------------------------------
+# LLM BACKEND HEALTH (circuit breakers)
+# ------------------------------------
+backend_status = metrics["backends"]
+if backend_status:
+    st.markdown("#### 🧠 LLM Backends")
+    backend_cols = st.columns(len(backend_status))
+    for col, (name, info) in zip(backend_cols, backend_status.items()):
+        icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}.get(info["state"], "⚪")
+        with col:
+            st.metric(f"{icon} {name}", info["state"].replace("_", " "))
+            st.caption(
+                f"calls {info.get('calls', 0)} · errors {info.get('errors', 0)} · "
+                f"avg {info.get('avg_latency', 0.0):.2f}s"
+            )
+            if info["state"] == "open":
+                st.caption(f"retry in {info['retry_in']:.0f}s")
+            if info.get("last_error"):
+                st.caption(f"last error: {info['last_error'][:120]}")
+
+# ------------------------------------
+# TOKEN / COST ACCOUNTING
+# ------------------------------------
+daily_usage = metrics["usage_by_day"]
+if daily_usage:
+    st.markdown("#### 💰 LLM Usage & Cost")
+    today = [row for row in daily_usage if row["day"] == time.strftime("%Y-%m-%d")]
+    u1, u2, u3, u4 = st.columns(4)
+    u1.metric("Calls today", sum(r["calls"] for r in today))
+    u2.metric("Input tokens today", sum(r["input_tokens"] or 0 for r in today))
+    u3.metric("Output tokens today", sum(r["output_tokens"] or 0 for r in today))
+    u4.metric("Cost today (USD)", f"{sum(r['cost_usd'] for r in today):.4f}")
+
+    with st.expander("Per day / backend"):
+        st.dataframe(daily_usage, use_container_width=True)
+    with st.expander("Per mailbox"):
+        st.dataframe(metrics.get("usage_by_mailbox", []), use_container_width=True)
+    with st.expander("Per ticket"):
+        st.dataframe(metrics["usage_by_ticket"], use_container_width=True)
+
+# ------------------------------------
+# TICKET PRIORITY QUEUE
+# ------------------------------------
+priorities = metrics["ticket_queue"]
+if any(p["depth"] or p["recent"] for p in priorities.values()):
+    st.markdown("#### 🎯 Ticket Queue")
+    prio_cols = st.columns(len(priorities))
+    for col, (level, info) in zip(prio_cols, priorities.items()):
+        with col:
+            st.metric(f"{level} waiting", info["depth"])
+            st.caption(f"avg wait {info['avg_wait']:.1f}s · max {info['max_wait']:.1f}s")
+            if info["depth"]:
+                st.caption(f"oldest {info['oldest_wait']:.0f}s")
+
+# ------------------------------------
+# RETRY QUEUE / DEAD LETTERS
+# ------------------------------------
+retrying = metrics["retry_queue"]
+dead = metrics["dead_letters"]
+if retrying or dead:
+    st.markdown("#### 🔁 Failed Tickets")
+    f1, f2 = st.columns(2)
+    f1.metric("Waiting for retry", len(retrying))
+    f2.metric("Dead letters", len(dead))
+
+    if retrying:
+        with st.expander("Retry queue"):
+            st.dataframe(
+                [
+                    {**row, "next_attempt": time.strftime("%H:%M:%S", time.localtime(row["next_attempt"]))}
+                    for row in retrying
+                ],
+                use_container_width=True,
+            )
+    if dead:
+        with st.expander("Dead letters", expanded=True):
+            st.dataframe(dead, use_container_width=True)
+            to_replay = st.selectbox(
+                "Ticket to replay",
+                [d["msg_id"] for d in dead],
+                format_func=lambda mid: next(f"{d['subject']} ({d['sender']}) - failed at {d['stage']}" for d in dead if d["msg_id"] == mid),
+            )
+            if st.button("🔁 Replay ticket", use_container_width=True):
+                if worker_api.replay(to_replay).get("replayed"):
+                    st.success("Ticket queued - the worker retries it on its next cycle.")
+
+# ------------------------------------
+# API RATE LIMITS (client-side token buckets)
+# ------------------------------------
+limits = metrics["rate_limits"]
+if limits:
+    with st.expander("🚦 API Rate Limits"):
+        st.dataframe(
+            [{"bucket": name, **info} for name, info in limits.items()],
+            use_container_width=True,
+        )
+
 st.markdown("#### 📜 Live Logs")
 
 # Auto-refresh ONLY when automation is running
-if st.session_state.automation_running:
+if worker["running"]:
     st_autorefresh(interval=2000, key="auto_refresh_logs")
 
-# Pull logs from queue into session_state.logs
-logs_pulled = 0
-while True:
-    try:
-        entry = log_queue.get_nowait()
-    except queue.Empty:
-        break
-    st.session_state.logs.append(entry)
-    logs_pulled += 1
+# Pull new worker log lines into session_state.logs
+new_logs = worker_api.logs(after=st.session_state.log_seq)
+st.session_state.logs.extend(new_logs["lines"])
+st.session_state.log_seq = new_logs["next"]
+logs_pulled = len(new_logs["lines"])
 
 if logs_pulled > 0:
     st.caption(f"🔄 Pulled {logs_pulled} new log entries")
@@ -317,4 +385,3 @@ if st.session_state.logs:
         st.caption(f"⏰ Last Update: {time.strftime('%H:%M:%S')}")
 else:
     st.info("📭 No logs yet. Start automation to see activity.")
-    st.caption(f"Current log queue size: {log_queue.qsize()}")
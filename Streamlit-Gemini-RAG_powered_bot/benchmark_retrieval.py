@@ -0,0 +1,268 @@
+"""
+Retrieval quality / latency benchmark against labeled tickets.
+
+Queries are generated from the knowledge base: every issue text is rewritten
+into a few customer-style paraphrases (synonyms, no issue number) labeled
+with its true issue_number. Each retrieval backend and embedding model is
+scored on recall@k, MRR and per-query latency (embedding + search), and the
+results go to a JSON report so runs can be compared.
+
+    python benchmark_retrieval.py --k 2 --chroma-dir ./chroma_langchain_db
+    python benchmark_retrieval.py --models sentence-transformers/all-mpnet-base-v2 \\
+        sentence-transformers/all-MiniLM-L6-v2 onnx:onnx_models/all-MiniLM-L6-v2-int8 \\
+        --backends numpy hybrid --report bench.json
+
+The Chroma store is queried through the same helper as the bot and only
+with the model recorded in its collection; other models get a throw-away
+numpy index and skip Chroma.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from embeddings import embedding_model_name, get_embedding_model
+from knowledge_base import knowledge_base_path, load_records, open_knowledge_base
+from vector_index import VectorIndex, vector_index_dir
+
+BACKENDS = ("numpy", "hybrid", "chroma")
+
+# (pattern in the lower-cased issue text, replacements a customer might write)
+SYNONYMS = [
+    (r"signal lost or static at 0v", ["no signal, reading flat at zero volts", "signal dropped, stuck at 0 V"]),
+    (r"signal lost", ["no signal", "lost the signal", "signal dropped out"]),
+    (r"signal clipping at max range", ["readings saturating at full scale", "values maxed out"]),
+    (r"high noise floor detected", ["very noisy readings", "lots of noise on the signal"]),
+    (r"bias voltage out of spec", ["bias voltage is wrong", "bias voltage is off"]),
+    (r"cross-talk from adjacent channel", ["interference from the neighbouring channel"]),
+    (r"\bch (\d+)", [r"channel \1", r"ch\1"]),
+    (r"analog input", ["analog in", "AI"]),
+    (r"digital input", ["digital in", "DI"]),
+    (r"stuck high", ["always high", "stays on"]),
+    (r"stuck low", ["always low", "stays off"]),
+    (r"rapid toggling", ["flickering", "keeps switching on and off"]),
+    (r"not detected", ["is not recognised", "is missing"]),
+    (r"\bfailed\b", ["fails", "is failing"]),
+    (r"timeout", ["times out", "time-out"]),
+    (r"temperature", ["temp"]),
+    (r"unexpectedly", ["randomly"]),
+    (r"\berror\b", ["fault", "problem"]),
+    (r"detected", ["showing", "seen"]),
+]
+
+TEMPLATES = [
+    "Hi team, {issue} on our {device}. Please help.",
+    "We are seeing {issue} since this morning.",
+    "{issue} - what should we check?",
+    "Hello, the {device} reports {issue}. Any fix?",
+    "Urgent: {issue}",
+]
+
+
+def paraphrase(record: dict, rng: random.Random) -> str:
+    issue = record["issue"].lower()
+    for pattern, replacements in SYNONYMS:
+        if re.search(pattern, issue) and rng.random() < 0.7:
+            issue = re.sub(pattern, rng.choice(replacements), issue)
+    issue = re.sub(r"\(\s*\)", "", issue).strip(" .")
+    return rng.choice(TEMPLATES).format(issue=issue, device=record.get("device") or "device")
+
+
+def labeled_queries(records: list, variants: int = 3, seed: int = 7) -> list:
+    """[(query, issue_number), ...] - `variants` paraphrases per issue, reproducible."""
+    rng = random.Random(seed)
+    queries = []
+    for record in records:
+        seen = set()
+        for _ in range(variants * 3):
+            query = paraphrase(record, rng)
+            if query not in seen:
+                seen.add(query)
+                queries.append((query, record["issue_number"]))
+            if len(seen) == variants:
+                break
+    return queries
+
+
+# ============================================
+# METRICS
+# ============================================
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def latency_summary(latencies: list) -> dict:
+    ms = [t * 1000 for t in latencies]
+    if not ms:
+        return {}
+    return {"mean_ms": statistics.mean(ms), "p50_ms": percentile(ms, 50), "p95_ms": percentile(ms, 95)}
+
+
+def score(found: list, label: int, k: int) -> tuple:
+    """(hit within top-k, reciprocal rank) for one query."""
+    for rank, number in enumerate(found[:k], start=1):
+        if number == label:
+            return 1, 1.0 / rank
+    return 0, 0.0
+
+
+def evaluate(name: str, search, queries: list, k: int) -> dict:
+    """search(query) -> [issue_number, ...] best first."""
+    hits, reciprocal, latencies = 0, 0.0, []
+    for query, label in queries:
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append(time.perf_counter() - start)
+        hit, rr = score(found, label, k)
+        hits += hit
+        reciprocal += rr
+
+    total = max(len(queries), 1)
+    result = {
+        "backend": name,
+        f"recall@{k}": hits / total,
+        "mrr": reciprocal / total,
+        "latency": latency_summary(latencies),
+    }
+    lat = result["latency"]
+    print(
+        f"  {name:<8} recall@{k} {result[f'recall@{k}']:6.1%} | MRR {result['mrr']:.3f} | "
+        f"mean {lat['mean_ms']:7.2f} ms | p50 {lat['p50_ms']:7.2f} ms | p95 {lat['p95_ms']:7.2f} ms"
+    )
+    return result
+
+
+# ============================================
+# BACKENDS
+# ============================================
+def open_index(records: list, model_name: str, embedding_model, index_dir: str, workdir: str):
+    """The on-disk index if it was built with this model, else a temporary one."""
+    from build_index import read_manifest
+
+    manifest = read_manifest(index_dir) or {}
+    if VectorIndex.exists(index_dir) and manifest.get("model") == model_name:
+        return VectorIndex.load(index_dir), 0.0
+
+    directory = os.path.join(workdir, re.sub(r"[^\w.-]+", "_", model_name))
+    print(f"  building temporary index for {model_name} ...")
+    start = time.perf_counter()
+    index = VectorIndex.build(records, embedding_model, directory)
+    return index, time.perf_counter() - start
+
+
+def benchmark_model(model_name: str, records: list, queries: list, args, workdir: str) -> list:
+    from retrieval import HybridRetriever
+
+    print(f"\nmodel {model_name}")
+    start = time.perf_counter()
+    embedding_model = get_embedding_model(model_name)
+    embedding_model.embed_query("warm up")
+    load_seconds = time.perf_counter() - start
+
+    embed_latencies = []
+    for query, _ in queries[:50]:
+        t = time.perf_counter()
+        embedding_model.embed_query(query)
+        embed_latencies.append(time.perf_counter() - t)
+
+    index, build_seconds = open_index(records, model_name, embedding_model, args.index_dir, workdir)
+    common = {
+        "model": model_name,
+        "dimension": index.dimension,
+        "model_load_seconds": load_seconds,
+        "index_build_seconds": build_seconds,
+        "embed_latency": latency_summary(embed_latencies),
+    }
+    print(f"  dim {index.dimension}, load {load_seconds:.1f}s, "
+          f"embed mean {common['embed_latency']['mean_ms']:.2f} ms/query")
+
+    results = []
+    if "numpy" in args.backends:
+        def numpy_search(query):
+            return [row["issue_number"] for row, _ in index.search(query, embedding_model, args.k)]
+
+        results.append(dict(common, **evaluate("numpy", numpy_search, queries, args.k)))
+
+    if "hybrid" in args.backends:
+        hybrid = HybridRetriever.from_env(index, embedding_model)
+
+        def hybrid_search(query):
+            return [row["issue_number"] for row, _ in hybrid.search(query, args.k)]
+
+        results.append(dict(common, **evaluate("hybrid", hybrid_search, queries, args.k)))
+
+    if "chroma" in args.backends:
+        try:
+            from build_index import chroma_model
+            from retrieval import _chroma_search, get_chroma
+
+            recorded = chroma_model(args.chroma_dir)
+        except ImportError:
+            print("  chroma   skipped (chromadb / langchain_community not installed)")
+        else:
+            if recorded != model_name:
+                # Querying it with this model's vectors would mix two embedding spaces
+                print(f"  chroma   skipped ({args.chroma_dir} was embedded with {recorded or 'an unrecorded model'}; "
+                      f"run build_index.py --model {model_name} --chroma-dir {args.chroma_dir} to benchmark it)")
+            else:
+                store = get_chroma(model_name, args.chroma_dir)
+                knowledge_base = open_knowledge_base(args.knowledge_base or knowledge_base_path())
+
+                def chroma_search(query):
+                    hits = _chroma_search([embedding_model.embed_query(query)], args.k, knowledge_base, store)[0]
+                    return [row.get("issue_number") for row, _ in hits]
+
+                results.append(dict(common, **evaluate("chroma", chroma_search, queries, args.k)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--knowledge-base", default=None)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--chroma-dir", default="./chroma_langchain_db")
+    parser.add_argument("--models", nargs="+", default=None, help="embedding models (default: EMBEDDING_MODEL)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--variants", type=int, default=3, help="paraphrases per issue")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--report", default="retrieval_benchmark.json", help="JSON report path")
+    args = parser.parse_args()
+    args.index_dir = args.index_dir or vector_index_dir()
+
+    records = load_records(args.knowledge_base)
+    queries = labeled_queries(records, args.variants, args.seed)
+    print(f"{len(queries)} labeled queries from {len(records)} issues, k={args.k}")
+    for query, label in queries[:3]:
+        print(f"  e.g. [{label}] {query}")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="retrieval-bench-") as workdir:
+        for model_name in args.models or [embedding_model_name()]:
+            results.extend(benchmark_model(model_name, records, queries, args, workdir))
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "knowledge_base": args.knowledge_base,
+        "issues": len(records),
+        "queries": len(queries),
+        "variants": args.variants,
+        "seed": args.seed,
+        "k": args.k,
+        "results": results,
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nreport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
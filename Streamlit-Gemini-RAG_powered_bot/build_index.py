@@ -0,0 +1,256 @@
+"""
+Offline build step for the knowledge-base vector index.
+
+Reads one or more issue JSON files, embeds "issue + solution" text in
+batches and writes the memory-mapped index plus a manifest.json that
+records the embedding model, dimension, row count and source hashes.
+Rows whose text did not change since the last build reuse their stored
+embedding, so only new or edited issues are sent through the model.
+The top related issues of every issue are precomputed into neighbors.json
+(see related_issues.py).
+
+    python build_index.py mtcm_intellipod.json
+    python build_index.py mtcm_intellipod.json possible_error.json --chroma-dir ./chroma_langchain_db
+    python build_index.py mtcm_intellipod.kbc          (columnar format, see kb_columnar.py)
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from embeddings import embedding_backend, embedding_model_name, get_embedding_model
+from knowledge_base import knowledge_base_path, knowledge_base_version, load_records, record_text
+from related_issues import DEFAULT_NEIGHBORS, NEIGHBORS_FILE, compute_neighbors, write_neighbors
+from vector_index import ROWS_FILE, VectorIndex, embed_texts, vector_index_dir
+
+MANIFEST_FILE = "manifest.json"
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return sha256_bytes(text.encode("utf-8"))
+
+
+def read_manifest(index_dir: str):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(index_dir: str, manifest: dict):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _previous_embeddings(index_dir: str, manifest, model_name: str) -> dict:
+    """Map text hash -> embedding from the last build (same model only)."""
+    if not manifest or manifest.get("model") != model_name or not VectorIndex.exists(index_dir):
+        return {}
+    index = VectorIndex.load(index_dir)
+    hashes = manifest.get("row_hashes", [])
+    if len(hashes) != len(index):
+        return {}
+    return {h: np.array(index.embeddings[i]) for i, h in enumerate(hashes)}
+
+
+CHROMA_COLLECTION = "langchain"
+
+
+def chroma_model(chroma_dir: str):
+    """Embedding model recorded in the Chroma collection, or None (missing or unrecorded)."""
+    import chromadb
+
+    try:
+        collection = chromadb.PersistentClient(path=chroma_dir).get_collection(CHROMA_COLLECTION)
+    except Exception:
+        return None
+    return (collection.metadata or {}).get("embedding_model")
+
+
+def sync_chroma(chroma_dir: str, rows: list, matrix: np.ndarray, model_name: str = None, log=print):
+    """
+    Upsert the same rows/embeddings into a Chroma collection used by langchain.
+    The collection records the embedding model; one built with another model
+    (or without a record) is dropped and rebuilt, never mixed.
+    """
+    import chromadb
+
+    model_name = model_name or embedding_model_name()
+    metadata = {"embedding_model": model_name, "dimension": int(matrix.shape[1])}
+    client = chromadb.PersistentClient(path=chroma_dir)
+    collection = client.get_or_create_collection(CHROMA_COLLECTION, metadata=metadata)
+    previous = collection.metadata or {}
+    if previous.get("embedding_model") != model_name or previous.get("dimension") != metadata["dimension"]:
+        log(f"♻️ Chroma collection in {chroma_dir} was built with {previous.get('embedding_model') or 'an unknown model'}, "
+            f"rebuilding with {model_name}")
+        client.delete_collection(CHROMA_COLLECTION)
+        collection = client.create_collection(CHROMA_COLLECTION, metadata=metadata)
+
+    ids = [str(r["issue_number"]) for r in rows]
+    stale = set(collection.get(include=[])["ids"]) - set(ids)
+    if stale:
+        collection.delete(ids=list(stale))
+
+    collection.upsert(
+        ids=ids,
+        embeddings=matrix.tolist(),
+        documents=[r["text"] for r in rows],
+        metadatas=[
+            {"issue_number": int(r["issue_number"]), "device": r.get("device", "")}
+            for r in rows
+        ],
+    )
+    log(f"Chroma collection in {chroma_dir} synced ({len(ids)} rows, {len(stale)} removed)")
+
+
+def dedupe_rows(rows: list, log=print) -> list:
+    """
+    One row per issue_number: a later row (or later source) replaces an earlier
+    one, the same rule as KnowledgeBase lookups. Duplicate numbers would collide
+    in the neighbors table and as Chroma ids.
+    """
+    by_number = {}
+    duplicates = []
+    for n, row in enumerate(rows):
+        try:
+            key = int(row["issue_number"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"row {n} ({row.get('issue', '')[:40]!r}) has no integer issue_number")
+        if key in by_number:
+            duplicates.append(key)
+            del by_number[key]
+        by_number[key] = row
+    if duplicates:
+        shown = ", ".join(map(str, sorted(set(duplicates))[:10]))
+        log(f"⚠️ {len(duplicates)} duplicate issue_number row(s) replaced by the later one: {shown}")
+    return list(by_number.values())
+
+
+def precompute_neighbors(index_dir: str, matrix: np.ndarray, rows: list, source_info: list,
+                         model_name: str, k: int, log=print):
+    """Top-k related issues per issue_number for this knowledge-base version."""
+    start = time.perf_counter()
+    table = compute_neighbors(matrix, rows, k)
+    write_neighbors(index_dir, table, [s["sha256"] for s in source_info], model_name)
+    log(f"Wrote {NEIGHBORS_FILE} ({len(table)} issues x {k} related, {time.perf_counter() - start:.2f}s)")
+
+
+def build_index(sources: list = None, index_dir: str = None, model_name: str = None,
+                batch_size: int = 64, force: bool = False, chroma_dir: str = None,
+                use_hnsw: bool = None, neighbors: int = DEFAULT_NEIGHBORS, reuse_from: str = None,
+                log=print) -> dict:
+    """
+    Build (or incrementally refresh) the vector index and return its manifest.
+    reuse_from: another index directory whose embeddings may be reused (used
+    when building into a fresh directory, see kb_manager.py).
+    """
+    sources = sources or [knowledge_base_path()]
+    index_dir = index_dir or vector_index_dir()
+    model_name = model_name or embedding_model_name()
+
+    source_info = []
+    for path in sources:
+        source_info.append({"path": os.path.basename(path), "sha256": knowledge_base_version(path)})
+    source_hash = sha256_bytes("".join(s["sha256"] for s in source_info).encode())
+
+    manifest = read_manifest(index_dir)
+    if (
+        not force
+        and manifest
+        and manifest.get("source_hash") == source_hash
+        and manifest.get("model") == model_name
+        and VectorIndex.exists(index_dir)
+    ):
+        log(f"Index in {index_dir} is up to date ({manifest['rows']} rows).")
+        if neighbors and not os.path.exists(os.path.join(index_dir, NEIGHBORS_FILE)):
+            index = VectorIndex.load(index_dir)
+            precompute_neighbors(index_dir, np.asarray(index.embeddings), index.rows, source_info, model_name, neighbors, log)
+        if chroma_dir and chroma_model(chroma_dir) != model_name:
+            index = VectorIndex.load(index_dir)
+            sync_chroma(chroma_dir, index.rows, np.asarray(index.embeddings), model_name, log)
+        return manifest
+
+    rows = dedupe_rows(
+        [dict(record, text=record_text(record)) for path in sources for record in load_records(path)], log
+    )
+    hashes = [text_hash(r["text"]) for r in rows]
+
+    if reuse_from:
+        cached = {} if force else _previous_embeddings(reuse_from, read_manifest(reuse_from), model_name)
+    else:
+        cached = {} if force else _previous_embeddings(index_dir, manifest, model_name)
+    missing = [i for i, h in enumerate(hashes) if h not in cached]
+
+    log(f"{len(rows)} rows from {len(sources)} source(s): "
+        f"{len(rows) - len(missing)} reused, {len(missing)} to embed with {model_name}")
+
+    fresh = {}
+    if missing:
+        embedding_model = get_embedding_model(model_name)
+        vectors = embed_texts(embedding_model, [rows[i]["text"] for i in missing], batch_size)
+        fresh = {hashes[i]: vectors[n] for n, i in enumerate(missing)}
+
+    matrix = np.stack([fresh[h] if h in fresh else cached[h] for h in hashes]).astype(np.float32)
+    VectorIndex.write(index_dir, matrix, rows, use_hnsw)
+
+    manifest = {
+        "model": model_name,
+        "embedding_backend": embedding_backend(model_name),
+        "dimension": int(matrix.shape[1]),
+        "rows": len(rows),
+        "source_hash": source_hash,
+        "sources": source_info,
+        "row_hashes": hashes,
+        "embedded": len(missing),
+        "reused": len(rows) - len(missing),
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    write_manifest(index_dir, manifest)
+    log(f"Wrote {ROWS_FILE}, embeddings and {MANIFEST_FILE} to {index_dir}")
+
+    if neighbors:
+        precompute_neighbors(index_dir, matrix, rows, source_info, model_name, neighbors, log)
+
+    if chroma_dir:
+        sync_chroma(chroma_dir, rows, matrix, model_name, log)
+
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="*", help="knowledge-base JSON / .kbc files (default: KNOWLEDGE_BASE_PATH)")
+    parser.add_argument("--index-dir", default=None, help="output directory (default: VECTOR_INDEX_DIR)")
+    parser.add_argument("--model", default=None, help="embedding model (default: EMBEDDING_MODEL)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--force", action="store_true", help="re-embed every row")
+    parser.add_argument("--hnsw", action="store_true", default=None, help="always build an HNSW graph")
+    parser.add_argument("--chroma-dir", default=None, help="also sync a Chroma store at this path")
+    parser.add_argument("--neighbors", type=int, default=DEFAULT_NEIGHBORS,
+                        help="related issues precomputed per issue (0 to skip)")
+    args = parser.parse_args()
+
+    build_index(
+        sources=args.sources,
+        index_dir=args.index_dir,
+        model_name=args.model,
+        batch_size=args.batch_size,
+        force=args.force,
+        chroma_dir=args.chroma_dir,
+        use_hnsw=args.hnsw,
+        neighbors=args.neighbors,
+    )
+
+
+if __name__ == "__main__":
+    main()
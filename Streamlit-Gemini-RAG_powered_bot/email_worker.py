@@ -1,39 +1,57 @@
 import base64
 import os
 import re
-import threading
 import time
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
+import retry_queue
 from email_generator import send_email
+from error_codes import ErrorCodeExtractor
 from gemini_llm_response import run_generator
+from knowledge_base import get_knowledge_base
+from llm_backends import backend_name
+from llm_stream import GenerationStats, LineBuffer
+from rate_limiter import FETCH, GMAIL_COSTS, SEND, Cancelled, get_limiter
+from ticket_priority import ticket_priority, ticket_queue
+from warmup import WarmUp
+from worker_controller import WorkerController
 
 # Scopes
 SCOPES_send = ["https://www.googleapis.com/auth/gmail.send"]
 SCOPES_read = ["https://www.googleapis.com/auth/gmail.readonly"]
 
-# Globals
-seen_ids = set()
-worker_running = False
-log_callback = None
+# Stream Gemini output into the live log while the reply is generated
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1").lower() in ("1", "true", "yes")
+
+# Longest time the ready signal waits for model/index warm-up
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "300"))
+
+# Seconds queued tickets may keep running after STOP before the worker aborts
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+
+# Unread messages fetched and classified per poll; they wait in the priority queue together
+POLL_BATCH = int(os.getenv("POLL_BATCH", "25"))
+
+# One worker per process, shared by every Streamlit session
+controller = WorkerController()
 
 
 # ============================================
 # LOGGING (THREAD-SAFE)
 # ============================================
 def log(msg: str):
-    """Logs to terminal AND safely queues for Streamlit."""
-    print(msg)  # Always print to console
-    if log_callback:
-        try:
-            # Use callback (which pushes to queue) - this is thread-safe
-            log_callback(msg)
-        except Exception as e:
-            print(f"[LOG ERROR] {e}")
+    """Logs to terminal AND to every subscribed Streamlit session."""
+    controller.log(msg)
+
+
+# ============================================
+# RATE-LIMITED GMAIL CALLS
+# ============================================
+def gmail_call(request, kind: str, priority: int = FETCH):
+    """Execute a Gmail API request under the mailbox quota; sends jump the queue."""
+    return get_limiter().call(
+        "gmail", request.execute, account=os.getenv("AUTOMATION_GMAIL"),
+        cost=GMAIL_COSTS[kind], priority=priority, log=log, cancel=controller.cancel_event,
+    )
 
 
 # ============================================
@@ -101,9 +119,8 @@ def is_purchase_or_spam(subject: str, sender: str, body: str) -> bool:
     return any(word in text for word in PURCHASE_SPAM_KEYWORDS)
 
 
-def process_new_message(service, msg_id):
-    msg = service.users().messages().get(userId="me", id=msg_id, format="full").execute()
-
+def parse_message(msg: dict) -> dict:
+    """Sender, subject, cleaned body and received time of a Gmail API message."""
     headers = msg.get("payload", {}).get("headers", [])
     sender = subject = "(unknown)"
 
@@ -116,14 +133,29 @@ def process_new_message(service, msg_id):
     raw_body = get_email_body(msg)
     body = get_clean_text(raw_body)
 
-    # Check conditions
-    if not subject_matches(subject):
-        log(f"⏭️ Skipping (Not tech-related): {subject}")
-        return None
+    # internalDate is epoch milliseconds
+    received = int(msg.get("internalDate", 0)) / 1000 or time.time()
+    return {"sender": sender, "subject": subject, "body": body, "received": received}
 
-    if is_purchase_or_spam(subject, sender, body):
-        log(f"⏭️ Skipping (Purchase/Spam): {subject}")
-        return None
+
+def skip_reason(message: dict):
+    """None for a tech-support request, else why it is skipped."""
+    if not subject_matches(message["subject"]):
+        return "Not tech-related"
+    if is_purchase_or_spam(message["subject"], message["sender"], message["body"]):
+        return "Purchase/Spam"
+    return None
+
+
+def classify_message(message: dict) -> bool:
+    """True if the parsed message is a tech-support request."""
+    sender, subject, body = message["sender"], message["subject"], message["body"]
+
+    # Check conditions
+    reason = skip_reason(message)
+    if reason:
+        log(f"⏭️ Skipping ({reason}): {subject}")
+        return False
 
     # Print details
     log("=" * 50)
@@ -132,14 +164,158 @@ def process_new_message(service, msg_id):
     log(f"📋 Subject: {subject}")
     log(f"💬 Body: {body[:200]}...")  # First 200 chars
     log("=" * 50)
+    return True
+
+
+def process_new_message(service, msg_id):
+    msg = gmail_call(service.users().messages().get(userId="me", id=msg_id, format="full"), "get")
+    message = parse_message(msg)
+    if not classify_message(message):
+        return None
+    return [message["sender"], message["subject"], message["body"]]
 
-    return [sender, subject, body]
+
+def error_codes_getter(body: str) -> list:
+    """All known issue numbers mentioned in the body, best match first."""
+    known = get_knowledge_base().issue_numbers
+    return ErrorCodeExtractor(known).extract(body)
 
 
 def error_code_getter(body: str):
-    pattern = r'[A-Za-z]+\s*[:\- ]\s*(\d+)'
-    match = re.search(pattern, body)
-    return match.group(1) if match else None
+    codes = error_codes_getter(body)
+    return str(codes[0]) if codes else None
+
+
+# ============================================
+# TICKET STAGES (fetch -> classify -> [priority queue] -> generate -> send)
+# ============================================
+def fetch_stage(service_read, ticket: dict) -> bool:
+    """Download and filter the message. False if it is not a support ticket."""
+    msg = gmail_call(service_read.users().messages().get(userId="me", id=ticket["msg_id"], format="full"), "get")
+    ticket.update(parse_message(msg))
+    return classify_message(ticket)
+
+
+def classify_stage(ticket: dict) -> bool:
+    """Extract error codes. False if no known code was found."""
+    log("🔍 Extracting error code from email body...")
+    codes = error_codes_getter(ticket["body"])
+
+    if not codes:
+        log("⚠️ No valid error code found. Skipping this email.")
+        return False
+
+    ticket["codes"] = codes
+    log(f"✅ Error code(s) identified: {', '.join(map(str, codes))}")
+    return True
+
+
+def generate_stage(ticket: dict):
+    """Write the reply for the ticket's error codes."""
+    codes = ticket["codes"]
+    msg_id, body = ticket["msg_id"], ticket["body"]
+    reply_msg = run_generator.template_reply(codes)
+    ticket["reply_source"] = "template" if reply_msg is not None else "llm"
+    if reply_msg is not None:
+        log("⚡ Known issue - reply rendered from template (no LLM call)")
+    elif STREAM_REPLIES:
+        log(f"🤖 Generating AI-powered response via {backend_name()}...")
+        stats = GenerationStats()
+        preview = LineBuffer(lambda line: log(f"✍️ {line}"))
+        reply_msg = "".join(
+            run_generator.stream_email(
+                codes, body, on_chunk=preview, stats=stats,
+                ticket_id=msg_id, mailbox=os.getenv("AUTOMATION_GMAIL"), cancel=controller.cancel_event,
+            )
+        )
+        preview.flush()
+        log(f"⏱️ Generation: {stats.summary()}")
+    else:
+        log(f"🤖 Generating AI-powered response via {backend_name()}...")
+        reply_msg = run_generator.generate_email(
+            codes, body, ticket_id=msg_id, mailbox=os.getenv("AUTOMATION_GMAIL"),
+            cancel=controller.cancel_event,
+        )
+
+    ticket["reply"] = reply_msg
+
+
+def send_stage(service_send, ticket: dict):
+    log("📤 Sending automated reply...")
+    get_limiter().call(
+        "gmail", lambda: send_email(service_send, ticket["sender"], "Reply for error", ticket["reply"]),
+        account=os.getenv("AUTOMATION_GMAIL"), cost=GMAIL_COSTS["send"], priority=SEND, log=log,
+        cancel=controller.cancel_event,
+    )
+
+    log("")
+    log("=" * 50)
+    log("📨 EMAIL SENT SUCCESSFULLY")
+    log(f"   To: {ticket['sender']}")
+    log(f"   Subject: Reply for error")
+    log(f"   Error Code: {', '.join(map(str, ticket['codes']))}")
+    log(f"   Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    log("=" * 50)
+
+
+def park_ticket(ticket: dict, error: Exception):
+    """Hand a failed ticket to the retry queue (or dead letters)."""
+    if isinstance(error, Cancelled):
+        retry_queue.defer(ticket)
+        log(f"⏸️ Ticket {ticket['msg_id']} interrupted at {ticket['stage']} - resumes on next start")
+        return
+    outcome = retry_queue.schedule_retry(ticket, f"{type(error).__name__}: {error}")
+    if outcome["dead"]:
+        log(f"☠️ Ticket {ticket['msg_id']} failed at {ticket['stage']} {outcome['attempts']} times - moved to dead letters: {error}")
+    else:
+        log(f"⚠️ Ticket {ticket['msg_id']} failed at {ticket['stage']}: {error} - retry in {outcome['delay']:.0f}s")
+
+
+def admit_ticket(service_read, ticket: dict) -> bool:
+    """
+    Fetch and classify a ticket, then queue it for generation by priority.
+    False if it was skipped or failed (failures go to the retry queue).
+    """
+    try:
+        if ticket["stage"] == retry_queue.FETCH:
+            if not fetch_stage(service_read, ticket):
+                retry_queue.complete(ticket["msg_id"])
+                return False
+            ticket["stage"] = retry_queue.GENERATE
+
+        if not ticket.get("codes") and not classify_stage(ticket):
+            retry_queue.complete(ticket["msg_id"])
+            return False
+
+        records = get_knowledge_base().get_many(ticket["codes"])
+        level = ticket_priority(records, ticket["sender"], ticket["body"])
+    except Exception as e:
+        park_ticket(ticket, e)
+        return False
+
+    ticket_queue.push(ticket, level)
+    log(f"📥 Queued ticket {ticket['msg_id']} as P{level} ({len(ticket_queue)} waiting)")
+    return True
+
+
+def run_ticket(service_send, ticket: dict) -> bool:
+    """
+    Run the remaining stages (generate, send) of a queued ticket. A failing
+    stage parks the ticket in the retry queue with what it has so far.
+    True once the reply has been sent.
+    """
+    try:
+        if ticket["stage"] == retry_queue.GENERATE:
+            generate_stage(ticket)
+            ticket["stage"] = retry_queue.SEND
+
+        send_stage(service_send, ticket)
+    except Exception as e:
+        park_ticket(ticket, e)
+        return False
+
+    retry_queue.complete(ticket["msg_id"])
+    return True
 
 
 # ============================================
@@ -147,6 +323,9 @@ def error_code_getter(body: str):
 # ============================================
 def authenticate():
     """Authenticate Gmail API with proper error handling."""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
     creds_read = None
     creds_send = None
     
@@ -198,8 +377,17 @@ def authenticate():
 # ============================================
 # WORKER LOOP (BACKGROUND THREAD)
 # ============================================
-def worker_loop(poll_interval: int):
-    global worker_running
+def worker_loop(controller: WorkerController, poll_interval: int):
+    from googleapiclient.discovery import build
+
+    from kb_manager import get_kb_manager
+
+    # Knowledge-base hot reloads report to the same log as the worker
+    get_kb_manager().log = log
+
+    # Load index / embedding model / LLM client while Gmail auth runs
+    log("🔥 Warming up retrieval index, embedding model and LLM client...")
+    warm = WarmUp(log=log).start()
 
     log("🔐 Authenticating Gmail services...")
 
@@ -211,113 +399,128 @@ def worker_loop(poll_interval: int):
         log(f"❌ Authentication failed: {e}")
         log("")
         log("📋 Fix: Ensure all JSON files are uploaded and valid")
-        worker_running = False
+        controller.finished()
         return
 
     log(f"✅ Gmail monitoring active (poll interval: {poll_interval}s)")
-    
-    # Signal to UI that worker is ready
-    if log_callback:
-        try:
-            log_callback("WORKER_READY_SIGNAL")
-        except:
-            pass
+
+    # Signal to UI that worker is ready - only once the whole pipeline is hot
+    # Nothing is queued yet, so a stop ends the wait at once instead of after the drain
+    if warm.wait(timeout=WARMUP_TIMEOUT, cancel=controller.stop_event):
+        log("✅ Pipeline warm - all components ready")
+        controller.ready.set()
+        log("WORKER_READY_SIGNAL")
+    elif not controller.stopping:
+        log("⚠️ Warm-up incomplete - processing continues, first tickets may be slow")
 
     log("⏸️  Press STOP in UI to halt automation")
     log("")
 
     email_count = 0
+    next_poll = 0.0
 
-    while worker_running:
+    while not controller.stopping:
         try:
-            results = service_read.users().messages().list(
-                userId="me", q="is:unread", maxResults=5
-            ).execute()
-
-            msgs = results.get("messages", [])
-
-            if not msgs:
-                # Reduced noise - only log occasionally
-                if email_count == 0:
-                    log("📭 No unread emails. Monitoring...")
-            
-            for item in msgs:
-                msg_id = item["id"]
-                if msg_id in seen_ids:
-                    continue
-
-                seen_ids.add(msg_id)
-                log("")
-                log("🔥 NEW MESSAGE DETECTED")
-
-                out = process_new_message(service_read, msg_id)
-                if out is None:
-                    continue
-
-                Sender, Subject, Body = out
-
-                log("🔍 Extracting error code from email body...")
-                err = error_code_getter(Body)
-
-                if err is None:
-                    log("⚠️ No valid error code found. Skipping this email.")
-                    continue
-
-                log(f"✅ Error code identified: {err}")
-                log("🤖 Generating AI-powered response via Gemini...")
-                
-                reply_msg = run_generator.generate_email(int(err), Body)
-
-                log("📤 Sending automated reply...")
-                send_email(service_send, Sender, "Reply for error", reply_msg)
-
-                email_count += 1
-
-                log("")
-                log("=" * 50)
-                log("📨 EMAIL SENT SUCCESSFULLY")
-                log(f"   To: {Sender}")
-                log(f"   Subject: Reply for error")
-                log(f"   Error Code: {err}")
-                log(f"   Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-                log(f"   Total Processed: {email_count}")
-                log("=" * 50)
-                log("")
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + poll_interval
+                poll_mailbox(service_read, email_count)
 
+            # One ticket per iteration, so mail polled in the meantime competes on
+            # priority with everything still queued instead of waiting for a drain
+            email_count += run_next(service_send, email_count)
+
+        except Cancelled:
+            break
         except Exception as e:
             log(f"⚠️ Worker error: {e}")
 
-        time.sleep(poll_interval)
+        if not len(ticket_queue):
+            controller.sleep(max(0.0, next_poll - time.monotonic()))
+
+    # Graceful drain: finish what is queued until the drain timeout aborts us
+    if len(ticket_queue) and not controller.aborted:
+        log(f"⏳ Draining {len(ticket_queue)} queued ticket(s) before stopping...")
+        drain_queue(service_send, email_count)
+
+    # Whatever is left resumes from the retry queue on the next start
+    while len(ticket_queue):
+        ticket = ticket_queue.pop()
+        retry_queue.defer(ticket)
+        log(f"⏸️ Ticket {ticket['msg_id']} deferred to next start")
 
+    controller.finished()
     log("🛑 Worker loop terminated.")
 
 
+def poll_mailbox(service_read, email_count: int = 0):
+    """Admit due retries and up to POLL_BATCH unread messages to the priority queue."""
+    # Tickets whose backoff expired resume at the stage that failed
+    for ticket in retry_queue.due_tickets():
+        log("")
+        log(f"🔁 Retrying ticket {ticket['msg_id']} at {ticket['stage']} (attempt {ticket['attempts'] + 1})")
+        admit_ticket(service_read, ticket)
+
+    results = gmail_call(
+        service_read.users().messages().list(userId="me", q="is:unread", maxResults=POLL_BATCH), "list"
+    )
+
+    msgs = results.get("messages", [])
+
+    if not msgs:
+        # Reduced noise - only log occasionally
+        if email_count == 0 and not len(ticket_queue):
+            log("📭 No unread emails. Monitoring...")
+
+    for item in msgs:
+        msg_id = item["id"]
+        if controller.stopping:
+            break
+        if retry_queue.is_tracked(msg_id) or not controller.claim(msg_id):
+            continue
+
+        log("")
+        log("🔥 NEW MESSAGE DETECTED")
+        admit_ticket(service_read, retry_queue.new_ticket(msg_id))
+
+
+def run_next(service_send, email_count: int = 0) -> int:
+    """Run the highest-priority queued ticket; returns 1 if its reply was sent."""
+    ticket = ticket_queue.pop()
+    if ticket is None:
+        return 0
+    log("")
+    log(f"🎯 Handling P{ticket['priority']} ticket from {ticket['sender']}")
+    if run_ticket(service_send, ticket):
+        log(f"   Total Processed: {email_count + 1}")
+        return 1
+    return 0
+
+
+def drain_queue(service_send, email_count: int = 0) -> int:
+    """Run queued tickets by priority until empty or aborted; returns replies sent."""
+    sent = 0
+    while len(ticket_queue) and not controller.aborted:
+        sent += run_next(service_send, email_count + sent)
+    return sent
+
+
 # ============================================
 # CONTROL (CALLED FROM STREAMLIT)
 # ============================================
-def start_worker(poll_interval: int, logger=None):
-    """Start background worker thread."""
-    global worker_running, log_callback
+def start_worker(poll_interval: int, logger=None, session=None) -> bool:
+    """Start the background worker unless one is already running (any session)."""
+    return controller.start(worker_loop, poll_interval, logger=logger, key=session)
 
-    if worker_running:
-        if logger:
-            logger("⚠️ Worker already running.")
-        return
 
-    log_callback = logger
-    worker_running = True
+def stop_worker(drain_timeout: float = None, wait: bool = False) -> bool:
+    """Stop taking new mail; queued tickets get drain_timeout seconds (DRAIN_TIMEOUT) to finish."""
+    return controller.stop(DRAIN_TIMEOUT if drain_timeout is None else drain_timeout, wait=wait)
 
-    t = threading.Thread(target=worker_loop, args=(poll_interval,), daemon=True)
-    t.start()
 
-    log("🚀 Background worker thread started")
+def subscribe_logs(logger, session=None):
+    """Attach a session's log sink to the (possibly already running) worker."""
+    controller.subscribe(logger, key=session)
 
 
-def stop_worker():
-    """Stop background worker thread."""
-    global worker_running
-    if worker_running:
-        worker_running = False
-        log("🛑 Stop signal sent - worker will halt after current cycle")
-    else:
-        log("ℹ️ Worker is not currently running")
+def worker_status() -> dict:
+    return controller.status()
@@ -0,0 +1,93 @@
+"""
+Embedding models used for the knowledge base and for queries.
+
+EMBEDDING_MODEL picks the model and the runtime:
+
+    sentence-transformers/all-mpnet-base-v2      PyTorch via HuggingFaceEmbeddings (default)
+    sentence-transformers/all-MiniLM-L6-v2       smaller PyTorch model (~5x faster on CPU)
+    onnx:onnx_models/all-MiniLM-L6-v2-int8       int8 ONNX export run by onnxruntime, no torch
+
+ONNX model directories are produced by export_onnx.py and hold model.onnx +
+tokenizer.json. The model string is stored in the vector index manifest, so
+an index is never queried with embeddings from a different model.
+"""
+import os
+import threading
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+ONNX_PREFIX = "onnx:"
+
+_models = {}
+_lock = threading.Lock()
+
+
+def embedding_model_name() -> str:
+    return os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+
+
+def embedding_backend(model_name: str = None) -> str:
+    model_name = model_name or embedding_model_name()
+    return "onnx" if model_name.startswith(ONNX_PREFIX) else "huggingface"
+
+
+class OnnxEmbeddings:
+    """
+    Sentence-transformers style embeddings (mean pooling + L2 norm) from an
+    ONNX export; same embed_query / embed_documents interface as LangChain.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 256, batch_size: int = 32):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime default
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: list):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+
+        hidden = self.session.run(None, feeds)[0]  # (batch, tokens, dim)
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(list(texts[start:start + self.batch_size])))
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self._embed_batch([text])[0]
+
+
+def get_embedding_model(model_name: str = None):
+    """Return a cached embedding model (loaded once per process)."""
+    model_name = model_name or embedding_model_name()
+    with _lock:
+        if model_name not in _models:
+            if model_name.startswith(ONNX_PREFIX):
+                _models[model_name] = OnnxEmbeddings(model_name[len(ONNX_PREFIX):])
+            else:
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+
+                _models[model_name] = HuggingFaceEmbeddings(model_name=model_name)
+        return _models[model_name]
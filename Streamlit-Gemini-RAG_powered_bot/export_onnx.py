@@ -0,0 +1,64 @@
+"""
+Export a sentence-transformers model to ONNX, optionally int8-quantized.
+
+    python export_onnx.py sentence-transformers/all-MiniLM-L6-v2 --out onnx_models/all-MiniLM-L6-v2-int8
+    EMBEDDING_MODEL=onnx:onnx_models/all-MiniLM-L6-v2-int8 python build_index.py
+
+Needs torch + transformers + onnxruntime at export time only; the bot itself
+then runs the model with onnxruntime and tokenizers alone. Rebuild the
+vector index (and Chroma store) after switching models.
+"""
+import argparse
+import os
+
+
+def export(model_name: str, out_dir: str, quantize: bool = True, opset: int = 14):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "tokens"} for name in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "tokens"}
+
+    fp32_path = os.path.join(out_dir, "model_fp32.onnx" if quantize else "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=opset,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, os.path.join(out_dir, "model.onnx"), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+
+    # tokenizer.json is what the runtime side (tokenizers) loads
+    tokenizer.save_pretrained(out_dir)
+    size = os.path.getsize(os.path.join(out_dir, "model.onnx")) / 1e6
+    print(f"Exported {model_name} -> {out_dir} ({'int8' if quantize else 'fp32'}, {size:.0f} MB)")
+    print(f"Use it with EMBEDDING_MODEL=onnx:{out_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="HuggingFace model id, e.g. sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--no-quantize", action="store_true", help="keep fp32 weights")
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+    export(args.model, args.out, quantize=not args.no_quantize, opset=args.opset)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,79 @@
 
 class run_generator:
     @staticmethod
-    def generate_email( issue_value, body):
-
-        import google.generativeai as genai
-        import pandas as pd
-        from dotenv import load_dotenv
-        import os
-        from langchain_community.embeddings import HuggingFaceEmbeddings
-        from langchain_community.vectorstores import Chroma
-        import warnings
-
-        warnings.filterwarnings('ignore')
-
-        load_dotenv(override = True)
-        gemini_api_key = os.getenv('GEMINI_API_KEY')
-        api_key = gemini_api_key 
-        
-        template = '''
-        Dear customer,
-
-        issue number:
-
-        issue:
-
-        solution:
-
-        Feel free to contact us
-
-        Best Regards,
-        Uday Hiremath
-        AI Expert
-        '''
-        data = pd.read_json('mtcm_intellipod.json')
-
-        issue_num = None
-        issue = None
-        solution = None
-
-
-        for i in zip(data['issue_number'], data['issue'], data['solution'], data['device']):
-            if i[0] == issue_value:
-                issue_num = i[0]
-                issue = i[1]
-                solution = i[2]
-                device = i[3]
-
-        embedding_model = HuggingFaceEmbeddings(
-            model_name = 'sentence-transformers/all-mpnet-base-v2'
-        )
-        vectordb = Chroma(
-            persist_directory = './chroma_langchain_db2',
-            embedding_function = embedding_model
-        )
-
-        vector_extract = vectordb.similarity_search(body, k = 2)
-        
-        if issue_num is None or issue is None or solution is None:
-            prompt = f"Consider yourself as tech supporter, here is possible issue  from vector database extraction {vector_extract}.Consider the inputs and generate the final ouput as clean email , mention issue number, issue and solution(descriptive),try to give one or more solution, generate in 150 words, here is templeate{template}"
-        else:
-            prompt = f"Consider yourself as tech supporter, here is possible issue number{issue_num}, issue {issue}, solution {solution}, device{device}  and vector database extraction {vector_extract}.Consider the inputs and generate the final ouput as clean email , mention issue number, issue and solution(descriptive),try to give one or more solution, generate in 150 words, here is templeate{template}"
-        
-        genai.configure(api_key=api_key)
-        
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        
-        response = model.generate_content(prompt)
+    def build_prompt( issue_value, body):
+
+        from kb_manager import current_snapshot
+        from prompt_builder import get_prompt_builder
+        from retrieval import retrieve, retrieve_many
+        from retrieval_policy import get_retrieval_policy
+
+        # One snapshot for the whole prompt: a hot reload never mixes versions
+        snapshot = current_snapshot()
+        issue_values = issue_value if isinstance(issue_value, (list, tuple, set)) else [issue_value]
+        records = snapshot.knowledge_base.get_many(issue_values)
+
+        policy = get_retrieval_policy()
+        if not policy.should_retrieve(records):
+            # Exact record found and RETRIEVAL_MODE=on_miss: no similarity search at all
+            return get_prompt_builder().build(records, [])
+
+        # Known codes: related issues come from the precomputed table, no embedding
+        hits = snapshot.related_hits([r['issue_number'] for r in records], k = 2) if records else None
+
+        if hits is None and len(records) > 1:
+            # Several codes in one ticket: one batched retrieval, one prompt, one reply
+            hits = [hit for related in retrieve_many([r['issue'] for r in records], k = 2, snapshot = snapshot) for hit in related]
+        elif hits is None:
+            # No code (or no table for this knowledge-base version): live vector search
+            hits = retrieve(body, k = 2, snapshot = snapshot)
+
+        return get_prompt_builder().build(records, policy.filter(hits, records))
+
+    @staticmethod
+    def template_reply( issue_value):
+        """Reply rendered without the LLM, or None when the LLM is needed."""
+
+        from knowledge_base import get_knowledge_base
+        from reply_templates import render_reply, reply_mode
+
+        if reply_mode() != 'template':
+            return None
+
+        issue_values = issue_value if isinstance(issue_value, (list, tuple, set)) else [issue_value]
+        records = get_knowledge_base().get_many(issue_values)
+        if not records or len(records) < len(set(issue_values)):
+            return None
+        return render_reply(records)
+
+    @staticmethod
+    def generate_email( issue_value, body, ticket_id = None, mailbox = None, cancel = None):
+
+        from llm_router import get_router
+        from usage_store import record_usage
+
+        prompt = run_generator.build_prompt(issue_value, body)
+        # Hedged requests that lose the race are billed too
+        on_usage = lambda backend, usage, latency: record_usage(backend, usage, latency, ticket_id, mailbox)
+
+        response = get_router().generate(prompt, cancel = cancel, on_usage = on_usage)
+        on_usage(response.backend, response.usage, response.latency)
         return response.text
+
+    @staticmethod
+    def stream_email( issue_value, body, on_chunk = None, stats = None, ticket_id = None, mailbox = None, cancel = None):
+        """Yield the reply chunk by chunk as the LLM produces it (see llm_stream.py)."""
+
+        from llm_router import get_router
+        from llm_stream import GenerationStats, stream_text
+        from usage_store import record_usage
+
+        prompt = run_generator.build_prompt(issue_value, body)
+        stats = stats if stats is not None else GenerationStats()
+        usage = {}
+        on_usage = lambda backend, reported, latency: record_usage(backend, reported, latency, ticket_id, mailbox)
+
+        chunks = get_router().stream(prompt, usage = usage, cancel = cancel, on_usage = on_usage)
+
+        yield from stream_text(chunks, on_chunk = on_chunk, stats = stats)
+        record_usage(usage.pop('backend', None), usage, stats.total, ticket_id, mailbox)
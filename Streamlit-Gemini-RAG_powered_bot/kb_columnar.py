@@ -0,0 +1,298 @@
+"""
+Compact columnar file format (.kbc) for the issue knowledge base.
+
+Pretty-printed JSON has to be parsed completely into one dict per record
+before the first lookup. A .kbc file is memory-mapped instead: opening it
+reads only a small header, columns are numpy views on the mapping, and a
+lookup is a binary search in the issue_number index plus decoding the one
+matching row. Nothing else is copied or parsed.
+
+    python kb_columnar.py mtcm_intellipod.json                      -> mtcm_intellipod.kbc
+    python kb_columnar.py mtcm_intellipod.json --out kb.kbc --verify
+    python kb_columnar.py mtcm_intellipod.kbc --to-json check.json
+    KNOWLEDGE_BASE_PATH=mtcm_intellipod.kbc                          use it in the bot
+
+Layout (little endian, every block 8-byte aligned):
+    magic    8 bytes    b"KBCOL\\x00\\x00\\x01"
+    length   uint64     size of the JSON header
+    header   JSON       {"rows", "version", "columns": [...], "index": {...}}, block = [offset, bytes];
+                        version is the sha256 of the rest of the header and the blocks
+    blocks   issue_number column   int64 per row
+             text / json column    uint64 offsets (rows + 1) and one UTF-8 blob;
+                                   a uint8 presence mask if some records lack the key
+             issue_number index    sorted int64 keys + int64 row ids
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b"KBCOL\x00\x00\x01"
+EXTENSION = ".kbc"
+_HEADER = len(MAGIC) + 8
+
+
+def is_columnar(data) -> bool:
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+# ============================================
+# WRITE
+# ============================================
+def write_columnar(records: list, path: str) -> dict:
+    """Write records to a .kbc file atomically (temp file then rename); returns the header."""
+    import numpy as np
+
+    numbers = []
+    for n, record in enumerate(records):
+        try:
+            numbers.append(int(record["issue_number"]))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"record {n} has no integer issue_number")
+    numbers = np.asarray(numbers, dtype="<i8")
+
+    names = []
+    for record in records:
+        names.extend(key for key in record if key not in names)
+
+    body = bytearray()
+
+    def put(data: bytes) -> list:
+        body.extend(b"\x00" * (_align(len(body)) - len(body)))
+        offset = len(body)
+        body.extend(data)
+        return [offset, len(data)]
+
+    columns = []
+    for name in names:
+        if name == "issue_number":
+            columns.append({"name": name, "type": "int", "values": put(numbers.tobytes())})
+            continue
+        present = [name in record for record in records]
+        kind = "str" if all(isinstance(r[name], str) for r in records if name in r) else "json"
+        encoded = [
+            (r[name] if kind == "str" else json.dumps(r[name], ensure_ascii=False)).encode("utf-8")
+            if name in r else b""
+            for r in records
+        ]
+        offsets = np.zeros(len(records) + 1, dtype="<u8")
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        column = {"name": name, "type": kind, "offsets": put(offsets.tobytes()), "data": put(b"".join(encoded))}
+        if not all(present):
+            column["present"] = put(np.asarray(present, dtype="u1").tobytes())
+        columns.append(column)
+
+    order = np.argsort(numbers, kind="stable")
+    index = {"keys": put(numbers[order].tobytes()), "rows": put(order.astype("<i8").tobytes())}
+
+    header = {"rows": len(records), "columns": columns, "index": index}
+    # Content hash stored once at write time: opening the file never has to read it all
+    header["version"] = hashlib.sha256(json.dumps(header, sort_keys=True).encode("utf-8") + body).hexdigest()
+    encoded_header = json.dumps(header).encode("utf-8")
+    start = _align(_HEADER + len(encoded_header))
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(encoded_header)))
+        f.write(encoded_header)
+        f.write(b"\x00" * (start - _HEADER - len(encoded_header)))
+        f.write(body)
+    os.replace(path + ".tmp", path)
+    return header
+
+
+# ============================================
+# READ
+# ============================================
+class _IssueNumbers:
+    """Set-like view of the issue_number index (membership is a binary search)."""
+
+    def __init__(self, knowledge_base):
+        self._kb = knowledge_base
+
+    def __contains__(self, issue_number):
+        return self._kb._position(issue_number) is not None
+
+    def __iter__(self):
+        import numpy as np
+
+        return (int(n) for n in np.unique(self._kb._keys))
+
+    def __len__(self):
+        import numpy as np
+
+        return int(len(np.unique(self._kb._keys)))
+
+
+class _Records:
+    """Sequence of records, decoded on access."""
+
+    def __init__(self, knowledge_base):
+        self._kb = knowledge_base
+
+    def __len__(self):
+        return self._kb.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._kb._row(n) for n in range(*i.indices(self._kb.rows))]
+        if i < 0:
+            i += self._kb.rows
+        if not 0 <= i < self._kb.rows:
+            raise IndexError(i)
+        return self._kb._row(i)
+
+    def __iter__(self):
+        return (self._kb._row(n) for n in range(self._kb.rows))
+
+
+class ColumnarKnowledgeBase:
+    """knowledge_base.KnowledgeBase interface over a .kbc buffer (bytes or mmap)."""
+
+    def __init__(self, buffer, source: str = None, version: str = None):
+        import numpy as np
+
+        if not is_columnar(buffer):
+            raise ValueError(f"{source or 'buffer'} is not a {EXTENSION} knowledge base")
+        length = struct.unpack_from("<Q", buffer, len(MAGIC))[0]
+        header = json.loads(bytes(buffer[_HEADER:_HEADER + length]))
+        base = _align(_HEADER + length)
+
+        def view(block, dtype):
+            offset, size = block
+            return np.frombuffer(buffer, dtype=dtype, count=size // np.dtype(dtype).itemsize, offset=base + offset)
+
+        self.source = source
+        self.version = version or header.get("version")
+        self.rows = header["rows"]
+        self._buffer = buffer
+        self._columns = []
+        for column in header["columns"]:
+            if column["type"] == "int":
+                self._numbers = view(column["values"], "<i8")
+                self._columns.append((column["name"], "int", None, None, None))
+            else:
+                present = view(column["present"], "u1") if "present" in column else None
+                self._columns.append((
+                    column["name"], column["type"], view(column["offsets"], "<u8"), base + column["data"][0], present,
+                ))
+        self._keys = view(header["index"]["keys"], "<i8")
+        self._row_ids = view(header["index"]["rows"], "<i8")
+        self.records = _Records(self)
+        self.issue_numbers = _IssueNumbers(self)
+
+    def _row(self, i: int) -> dict:
+        record = {}
+        for name, kind, offsets, data, present in self._columns:
+            if kind == "int":
+                record[name] = int(self._numbers[i])
+                continue
+            if present is not None and not present[i]:
+                continue
+            text = bytes(self._buffer[data + int(offsets[i]):data + int(offsets[i + 1])]).decode("utf-8")
+            record[name] = text if kind == "str" else json.loads(text)
+        return record
+
+    def _position(self, issue_number):
+        """Row id of the last record with this issue_number (same rule as KnowledgeBase), or None."""
+        import numpy as np
+
+        try:
+            issue_number = int(issue_number)
+        except (TypeError, ValueError):
+            return None
+        pos = int(np.searchsorted(self._keys, issue_number, side="right")) - 1
+        if pos < 0 or self._keys[pos] != issue_number:
+            return None
+        return int(self._row_ids[pos])
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, issue_number):
+        return self._position(issue_number) is not None
+
+    def get(self, issue_number):
+        row = self._position(issue_number)
+        return None if row is None else self._row(row)
+
+    def get_many(self, issue_numbers) -> list:
+        """Records for every known number, in the given order, without duplicates."""
+        found, seen = [], set()
+        for number in issue_numbers:
+            row = self._position(number)
+            if row is not None and row not in seen:
+                seen.add(row)
+                found.append(self._row(row))
+        return found
+
+
+def open_columnar(path: str, version: str = None) -> ColumnarKnowledgeBase:
+    """
+    Memory-map a .kbc file; pages are read by the OS only when touched. The
+    version is the content hash from the header (mtime + size for files
+    written before the header had one).
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        st = os.fstat(f.fileno())
+    knowledge_base = ColumnarKnowledgeBase(mapped, source=path, version=version)
+    if knowledge_base.version is None:
+        knowledge_base.version = hashlib.sha256(f"{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()
+    return knowledge_base
+
+
+# ============================================
+# CONVERSION COMMAND
+# ============================================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="knowledge-base JSON (or a .kbc file with --to-json)")
+    parser.add_argument("--out", default=None, help=f"output file (default: source with {EXTENSION})")
+    parser.add_argument("--verify", action="store_true", help="re-open the output and compare every record")
+    parser.add_argument("--to-json", metavar="PATH", default=None, help="convert a .kbc file back to JSON")
+    args = parser.parse_args()
+
+    if args.to_json:
+        records = list(open_columnar(args.source).records)
+        with open(args.to_json, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+        print(f"Wrote {len(records)} records to {args.to_json}")
+        return
+
+    out = args.out or os.path.splitext(args.source)[0] + EXTENSION
+    start = time.perf_counter()
+    with open(args.source, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    json_seconds = time.perf_counter() - start
+
+    header = write_columnar(records, out)
+
+    start = time.perf_counter()
+    knowledge_base = open_columnar(out)
+    open_seconds = time.perf_counter() - start
+
+    print(f"{args.source} -> {out}: {header['rows']} rows, {len(header['columns'])} columns")
+    print(f"size  {os.path.getsize(args.source) / 1e3:.1f} kB -> {os.path.getsize(out) / 1e3:.1f} kB")
+    print(f"load  json {json_seconds * 1e3:.2f} ms, {EXTENSION} open {open_seconds * 1e3:.2f} ms")
+
+    if args.verify:
+        expected = {}
+        for record in records:
+            expected[int(record["issue_number"])] = dict(record, issue_number=int(record["issue_number"]))
+        mismatched = [n for n, record in expected.items() if knowledge_base.get(n) != record]
+        rows_ok = all(a == dict(b, issue_number=int(b["issue_number"])) for a, b in zip(knowledge_base.records, records))
+        if mismatched or not rows_ok:
+            raise SystemExit(f"verify failed: {len(mismatched)} issue lookups differ, rows identical: {rows_ok}")
+        print(f"verify ok: {len(expected)} issue lookups and {len(records)} rows identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Knowledge-base hot reload with copy-on-write snapshots.
+
+A KnowledgeSnapshot bundles what one ticket reads: the parsed knowledge base,
+its vector index, the hybrid retriever and the related-issues table, all from
+one version (sha256) of the knowledge-base file. A ticket takes the current snapshot
+once and uses it to the end, so a reload never mixes two versions in one
+reply, and nothing re-reads the file per ticket.
+
+KnowledgeBaseManager watches KNOWLEDGE_BASE_PATH (or is told about an upload
+through reload()) and builds the next snapshot in a background thread: the
+new bytes are copied into their own index directory, embeddings are built
+incrementally from the previous index, and the result replaces the current
+snapshot with a single reference swap. A half-written or invalid file is
+ignored and the old snapshot keeps serving. A .kbc knowledge base is
+memory-mapped from its per-snapshot copy, never read whole.
+
+    KB_WATCH=1              poll the file for changes
+    KB_WATCH_INTERVAL=5     seconds between polls
+    KB_KEEP_SNAPSHOTS=2     hot-reload index directories kept on disk
+
+The first snapshot also reads from a copy of the file but keeps its index in
+VECTOR_INDEX_DIR itself, built from that copy only when retrieval first needs
+it. A Chroma store (RETRIEVAL_BACKEND=chroma) is synced with every snapshot's
+index build but is shared, not versioned.
+"""
+import os
+import shutil
+import threading
+import time
+
+from kb_columnar import open_columnar
+from knowledge_base import KnowledgeBase, is_columnar_file, knowledge_base_path, parse_knowledge_base
+
+SNAPSHOTS_DIR = "snapshots"
+
+
+class KnowledgeSnapshot:
+    def __init__(self, knowledge_base: KnowledgeBase, index_dir: str, build=None, source: str = None):
+        self.knowledge_base = knowledge_base
+        self.version = knowledge_base.version
+        self.index_dir = index_dir
+        self.source = source  # the file this version was read from
+        self.loaded_at = time.time()
+        self._build = build  # builds index_dir on first use
+        self._index = None
+        self._retriever = None
+        self._lock = threading.Lock()
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    def vector_index(self):
+        with self._lock:
+            if self._index is None:
+                from vector_index import VectorIndex
+
+                if self._build is not None:
+                    self._build()
+                self._index = VectorIndex.load(self.index_dir)
+            return self._index
+
+    def retriever(self):
+        index = self.vector_index()
+        with self._lock:
+            if self._retriever is None:
+                from retrieval import HybridRetriever
+
+                self._retriever = HybridRetriever.from_env(index)
+            return self._retriever
+
+    def related_hits(self, issue_numbers: list, k: int = 2):
+        from related_issues import related_hits
+
+        return related_hits(issue_numbers, k, knowledge_base=self.knowledge_base, index_dir=self.index_dir)
+
+
+class KnowledgeBaseManager:
+    def __init__(self, path: str = None, index_dir: str = None, keep: int = 2, log=print):
+        from vector_index import vector_index_dir
+
+        self.path = path or knowledge_base_path()
+        self.index_dir = index_dir or vector_index_dir()
+        self.keep = keep
+        self.log = log
+        self._snapshot = None
+        self._stat = None
+        self._lock = threading.Lock()
+        self._pending = False
+        self._builder = None
+        self._watcher = None
+        self.reloads = 0
+        self.last_error = None
+
+    # ============================================
+    # SNAPSHOTS
+    # ============================================
+    def current(self) -> KnowledgeSnapshot:
+        """The live snapshot; loaded on first use."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._initial_snapshot()
+                snapshot = self._snapshot
+        return snapshot
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        """
+        File bytes and their parsed knowledge base; raises on a changing or
+        invalid file. A .kbc file is memory-mapped instead (bytes are None).
+        """
+        before = self._file_stat()
+        if is_columnar_file(self.path):
+            data, knowledge_base = None, open_columnar(self.path)
+        else:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            knowledge_base = parse_knowledge_base(data, source=self.path)
+        if self._file_stat() != before:
+            raise ValueError("file changed while reading")
+        return before, data, knowledge_base
+
+    def _chroma_dir(self):
+        from retrieval import retrieval_backend
+
+        return os.getenv("CHROMA_DIR", "./chroma_langchain_db") if retrieval_backend() == "chroma" else None
+
+    def _snapshot_source(self, stat, data, knowledge_base):
+        """
+        Copy the bytes that were parsed into snapshots/<version>/, so the index is
+        built from exactly that version even if the file changes before the
+        (lazy) build. Returns the copy and the knowledge base to serve.
+        """
+        snapshot_dir = os.path.join(self.index_dir, SNAPSHOTS_DIR, knowledge_base.version[:12])
+        os.makedirs(snapshot_dir, exist_ok=True)
+        source = os.path.join(snapshot_dir, os.path.basename(self.path))
+        if data is None:
+            # .kbc: the snapshot maps its own copy, so a later upload never changes it under readers
+            shutil.copy2(self.path, source + ".tmp")
+            os.replace(source + ".tmp", source)
+            if self._file_stat() != stat:
+                raise ValueError("file changed while reading")
+            knowledge_base = open_columnar(source)
+        else:
+            with open(source + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(source + ".tmp", source)
+        return source, knowledge_base
+
+    def _initial_snapshot(self) -> KnowledgeSnapshot:
+        stat, data, knowledge_base = self._read()
+        source, knowledge_base = self._snapshot_source(stat, data, knowledge_base)
+        self._stat = stat
+
+        def build():
+            from build_index import build_index
+
+            # Refresh VECTOR_INDEX_DIR in place: missing, stale or built with another model
+            build_index(sources=[source], index_dir=self.index_dir, chroma_dir=self._chroma_dir(), log=self.log)
+
+        return KnowledgeSnapshot(knowledge_base, self.index_dir, build, source=source)
+
+    def _next_snapshot(self, previous: KnowledgeSnapshot):
+        stat, data, knowledge_base = self._read()
+        if knowledge_base.version == previous.version:
+            self._stat = stat
+            return None
+
+        source, knowledge_base = self._snapshot_source(stat, data, knowledge_base)
+        index_dir = os.path.dirname(source)
+
+        def build():
+            from build_index import build_index
+
+            build_index(sources=[source], index_dir=index_dir, chroma_dir=self._chroma_dir(),
+                        reuse_from=previous.index_dir, log=self.log)
+
+        snapshot = KnowledgeSnapshot(knowledge_base, index_dir, build, source=source)
+        if previous.indexed:
+            # This process retrieves: have embeddings, index and retriever ready before the swap
+            from retrieval import retrieval_backend
+
+            snapshot.vector_index()
+            if retrieval_backend() == "hybrid":
+                snapshot.retriever()
+        self._stat = stat
+        return snapshot
+
+    def _prune(self, live: set):
+        root = os.path.join(self.index_dir, SNAPSHOTS_DIR)
+        if not os.path.isdir(root):
+            return
+        dirs = sorted(
+            (os.path.join(root, name) for name in os.listdir(root)),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for path in dirs[self.keep:]:
+            if os.path.abspath(path) not in live:
+                shutil.rmtree(path, ignore_errors=True)
+
+    # ============================================
+    # RELOAD
+    # ============================================
+    def reload(self, wait: bool = False):
+        """Build the next snapshot in the background; concurrent requests are coalesced."""
+        with self._lock:
+            self._pending = True
+            if self._builder is None:
+                self._builder = threading.Thread(target=self._build_loop, name="kb-builder", daemon=True)
+                self._builder.start()
+            builder = self._builder
+        if wait:
+            builder.join()
+
+    def _build_loop(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._builder = None
+                    return
+                self._pending = False
+
+            previous = self.current()
+            start = time.perf_counter()
+            try:
+                snapshot = self._next_snapshot(previous)
+            except Exception as e:
+                self.last_error = str(e)
+                self.log(f"⚠️ Knowledge base reload skipped, still serving {previous.version[:12]}: {e}")
+                continue
+
+            self.last_error = None
+            if snapshot is None:
+                continue
+            with self._lock:
+                self._snapshot = snapshot
+                self.reloads += 1
+            live = {snapshot.index_dir, previous.index_dir, os.path.dirname(previous.source)}
+            self._prune({os.path.abspath(path) for path in live})
+            self.log(
+                f"📚 Knowledge base {snapshot.version[:12]} live "
+                f"({len(snapshot.knowledge_base)} issues, built in {time.perf_counter() - start:.1f}s)"
+            )
+
+    def watch(self, interval: float = 5.0):
+        """Poll the file; reload once a change has been stable for one interval."""
+        if self._watcher is not None:
+            return
+
+        def loop():
+            seen, requested = self._file_stat(), None
+            while True:
+                time.sleep(interval)
+                stat = self._file_stat()
+                if (
+                    stat is not None and stat == seen and stat != self._stat
+                    and stat != requested and self._snapshot is not None
+                ):
+                    requested = stat  # an invalid file is tried once, not every poll
+                    self.reload()
+                seen = stat
+
+        self._watcher = threading.Thread(target=loop, name="kb-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "file": self.path,
+            "version": snapshot.version[:12] if snapshot else None,
+            "issues": len(snapshot.knowledge_base) if snapshot else 0,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "indexed": snapshot.indexed if snapshot else False,
+            "reloading": self._builder is not None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+
+# ============================================
+# PROCESS-WIDE INSTANCE
+# ============================================
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_kb_manager() -> KnowledgeBaseManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = KnowledgeBaseManager(keep=int(os.getenv("KB_KEEP_SNAPSHOTS", "2")))
+            if os.getenv("KB_WATCH", "1").lower() in ("1", "true", "yes"):
+                _manager.watch(float(os.getenv("KB_WATCH_INTERVAL", "5")))
+        return _manager
+
+
+def current_snapshot() -> KnowledgeSnapshot:
+    return get_kb_manager().current()
+
+
+def kb_status():
+    """Manager status, or None when no knowledge base was loaded in this process."""
+    return _manager.status() if _manager is not None else None
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+from kb_columnar import ColumnarKnowledgeBase, is_columnar, open_columnar
+
+DEFAULT_KNOWLEDGE_BASE = "mtcm_intellipod.json"
+
+
+def knowledge_base_path() -> str:
+    """Path of the issue/solution knowledge base (JSON or .kbc, see kb_columnar.py)."""
+    return os.getenv("KNOWLEDGE_BASE_PATH", DEFAULT_KNOWLEDGE_BASE)
+
+
+def load_records(path: str = None) -> list:
+    """Load the raw issue records (list of dicts) from a JSON or .kbc knowledge base."""
+    path = path or knowledge_base_path()
+    if is_columnar_file(path):
+        return list(open_columnar(path).records)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_text(record: dict) -> str:
+    """Text that gets embedded for one issue - same layout as the Chroma documents."""
+    return f"issue : {record.get('issue', '')}\nsolution : {record.get('solution', '')}"
+
+
+class KnowledgeBase:
+    """Issue records indexed by issue_number for O(1) lookups."""
+
+    def __init__(self, records: list, source: str = None, version: str = None):
+        self.source = source
+        self.version = version  # sha256 of the source file
+        self.records = records
+        self.by_number = {}
+        for record in records:
+            try:
+                self.by_number[int(record["issue_number"])] = record
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.issue_numbers = frozenset(self.by_number)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, issue_number):
+        return self.get(issue_number) is not None
+
+    def get(self, issue_number):
+        try:
+            return self.by_number.get(int(issue_number))
+        except (TypeError, ValueError):
+            return None
+
+    def get_many(self, issue_numbers) -> list:
+        """Records for every known number, in the given order, without duplicates."""
+        found, seen = [], set()
+        for number in issue_numbers:
+            record = self.get(number)
+            if record is not None and id(record) not in seen:
+                seen.add(id(record))
+                found.append(record)
+        return found
+
+
+def parse_knowledge_base(data: bytes, source: str = None):
+    """KnowledgeBase (JSON) or ColumnarKnowledgeBase (.kbc) for the file's bytes."""
+    if is_columnar(data):
+        knowledge_base = ColumnarKnowledgeBase(data, source=source)
+        knowledge_base.version = knowledge_base.version or hashlib.sha256(data).hexdigest()
+        return knowledge_base
+    return KnowledgeBase(json.loads(data), source=source, version=hashlib.sha256(data).hexdigest())
+
+
+def is_columnar_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return is_columnar(f.read(8))
+
+
+def open_knowledge_base(path: str):
+    """Parse a JSON knowledge base, or memory-map a .kbc one without reading it."""
+    if is_columnar_file(path):
+        return open_columnar(path)
+    with open(path, "rb") as f:
+        return parse_knowledge_base(f.read(), source=path)
+
+
+def knowledge_base_version(path: str) -> str:
+    """The version a knowledge base loaded from path carries (related_issues.py keys on it)."""
+    if is_columnar_file(path):
+        return open_columnar(path).version
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+_cache = {}
+
+
+def get_knowledge_base(path: str = None) -> KnowledgeBase:
+    """
+    The live knowledge base. KNOWLEDGE_BASE_PATH comes from the current
+    kb_manager snapshot (hot-reloaded in the background); any other file is
+    loaded once and again only when its mtime changes (.kbc files are
+    memory-mapped rather than read).
+    """
+    path = path or knowledge_base_path()
+    if path == knowledge_base_path():
+        from kb_manager import current_snapshot
+
+        return current_snapshot().knowledge_base
+    mtime = os.path.getmtime(path)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, open_knowledge_base(path))
+        _cache[path] = cached
+    return cached[1]
@@ -0,0 +1,66 @@
+"""
+In-memory BM25 inverted index over issue + solution text.
+
+Exact tokens such as channel names ("Ch 1") or sensor codes ("IEPE") are
+matched lexically, which is both more precise and far cheaper than an
+embedding lookup. Adjacent-token bigrams ("ch_1") are indexed as extra
+terms so short phrases outrank documents that only share one word.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or our "
+    "the this to was we with my me you your please hi hello dear regards".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens plus adjacent bigrams."""
+    words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class BM25Index:
+    def __init__(self, texts: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(doc_id, term_freq), ...]
+        self.doc_len = []
+
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+
+        n = len(self.doc_len)
+        self.avg_len = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1.0 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def scores(self, query: str) -> dict:
+        """Return {doc_id: bm25_score} for every document sharing a query term."""
+        out = defaultdict(float)
+        k1, b, avg = self.k1, self.b, self.avg_len or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = k1 * (1.0 - b + b * self.doc_len[doc_id] / avg)
+                out[doc_id] += idf * tf * (k1 + 1.0) / (tf + norm)
+        return out
+
+    def search(self, query: str, k: int = 2) -> list:
+        """Return [(doc_id, score), ...] best first."""
+        scored = self.scores(query)
+        return sorted(scored.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,358 @@
+"""
+Pluggable LLM backends behind one interface.
+
+    backend = get_backend()                 # LLM_BACKEND=gemini | ollama | fake
+    response = backend.generate(prompt)     # -> LLMResponse(text, usage, latency)
+    for chunk in backend.stream(prompt): ...
+
+Each backend owns its client/connection pool, timeout, concurrency limit
+and metrics. Settings come from the environment (re-read from .env on every
+get_backend() call), so load can be moved between backends without a
+redeploy:
+
+    LLM_BACKEND=ollama
+    LLM_OLLAMA_TIMEOUT=120
+    LLM_OLLAMA_CONCURRENCY=2
+
+Calls also queue on the request rate in rate_limiter.py, one bucket per
+backend account (Gemini API key, Ollama host). A 429 pushes that bucket back
+by the server's Retry-After and the call is retried up to
+LLM_RATE_LIMIT_RETRIES times; a set cancel event abandons the wait.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from rate_limiter import GENERATE, get_limiter
+
+DEFAULT_BACKEND = "gemini"
+
+
+class LLMResponse:
+    def __init__(self, text: str, backend: str, latency: float, usage: dict = None):
+        self.text = text
+        self.backend = backend
+        self.latency = latency
+        self.usage = usage or {}  # input_tokens / output_tokens when the backend reports them
+
+    def __repr__(self):
+        return f"LLMResponse(backend={self.backend!r}, latency={self.latency:.2f}s, usage={self.usage})"
+
+
+class BackendMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+        self.last_error = None
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, latency: float, error: Exception = None):
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.total_latency += latency
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "avg_latency": (self.total_latency / self.calls) if self.calls else 0.0,
+                "last_error": self.last_error,
+            }
+
+
+class LLMBackend:
+    name = None
+
+    def __init__(self, timeout: float = 60.0, max_concurrency: int = 4):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.metrics = BackendMetrics()
+
+    # Subclasses implement these two
+    def _generate(self, prompt: str):
+        """Return (text, usage_dict)."""
+        raise NotImplementedError
+
+    def _stream(self, prompt: str, usage: dict):
+        """Yield text chunks; fill `usage` once the backend reports it."""
+        text, reported = self._generate(prompt)
+        usage.update(reported)
+        yield text
+
+    def account(self):
+        """Quota account of this backend: calls on the same account share one bucket."""
+        return None
+
+    def generate(self, prompt: str, cancel=None) -> LLMResponse:
+        return get_limiter().call(
+            self.name, lambda: self._timed_generate(prompt), account=self.account(),
+            priority=GENERATE, retries=rate_limit_retries(), cancel=cancel,
+        )
+
+    def _timed_generate(self, prompt: str) -> LLMResponse:
+        with self._slots:
+            self.metrics.begin()
+            start = time.perf_counter()
+            error = None
+            try:
+                text, usage = self._generate(prompt)
+                return LLMResponse(text, self.name, time.perf_counter() - start, usage)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.metrics.end(time.perf_counter() - start, error)
+
+    def stream(self, prompt: str, usage: dict = None, cancel=None):
+        usage = usage if usage is not None else {}
+        return get_limiter().stream(
+            self.name, lambda: self._timed_stream(prompt, usage), account=self.account(),
+            priority=GENERATE, retries=rate_limit_retries(), cancel=cancel,
+        )
+
+    def _timed_stream(self, prompt: str, usage: dict):
+        with self._slots:
+            self.metrics.begin()
+            start = time.perf_counter()
+            error = None
+            try:
+                yield from self._stream(prompt, usage)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.metrics.end(time.perf_counter() - start, error)
+
+    def warm_up(self):
+        """Readiness probe: connect and load the model without a billed generation."""
+        with self._slots:
+            self._probe()
+
+    def _probe(self):
+        pass
+
+
+# ============================================
+# REGISTRY
+# ============================================
+BACKENDS = {}
+
+
+def register_backend(name: str):
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+@register_backend("gemini")
+class GeminiBackend(LLMBackend):
+    def __init__(self, model: str = None, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+
+        self.genai = genai
+        self.api_key = None
+        self.model = genai.GenerativeModel(model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash"))
+        self._configure()
+
+    def account(self):
+        # Gemini quotas are per API key; keep the key itself out of the dashboard
+        return hashlib.sha256((os.getenv("GEMINI_API_KEY") or "").encode()).hexdigest()[:8]
+
+    def _configure(self):
+        # The key can be changed from the dashboard (.env) while the process runs
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key != self.api_key:
+            self.genai.configure(api_key=api_key)
+            self.api_key = api_key
+
+    @staticmethod
+    def _usage(response) -> dict:
+        meta = getattr(response, "usage_metadata", None)
+        if meta is None:
+            return {}
+        return {
+            "input_tokens": getattr(meta, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(meta, "candidates_token_count", 0) or 0,
+        }
+
+    def _probe(self):
+        # Model metadata: checks key, network and model name; no tokens are billed
+        self._configure()
+        self.genai.get_model(self.model.model_name, request_options={"timeout": self.timeout})
+
+    def _generate(self, prompt: str):
+        self._configure()
+        response = self.model.generate_content(prompt, request_options={"timeout": self.timeout})
+        return response.text, self._usage(response)
+
+    def _stream(self, prompt: str, usage: dict):
+        self._configure()
+        response = self.model.generate_content(
+            prompt, stream=True, request_options={"timeout": self.timeout}
+        )
+        for chunk in response:
+            yield chunk.text
+        usage.update(self._usage(response))
+
+
+@register_backend("ollama")
+class OllamaBackend(LLMBackend):
+    """Ollama over its HTTP API, with a pooled keep-alive session (no subprocess per call)."""
+
+    def __init__(self, model: str = None, host: str = None, **kwargs):
+        super().__init__(**kwargs)
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.model = model or os.getenv("OLLAMA_MODEL", "llama3.2:3b")
+        self.host = (host or os.getenv("OLLAMA_HOST", "http://localhost:11434")).rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def account(self):
+        return self.host
+
+    @staticmethod
+    def _usage(payload: dict) -> dict:
+        return {
+            "input_tokens": payload.get("prompt_eval_count", 0),
+            "output_tokens": payload.get("eval_count", 0),
+        }
+
+    def _probe(self):
+        # An empty prompt only loads the model into memory
+        r = self.session.post(
+            f"{self.host}/api/generate", json={"model": self.model, "prompt": ""}, timeout=self.timeout,
+        )
+        r.raise_for_status()
+
+    def _generate(self, prompt: str):
+        r = self.session.post(
+            f"{self.host}/api/generate",
+            json={"model": self.model, "prompt": prompt, "stream": False},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        payload = r.json()
+        return payload.get("response", ""), self._usage(payload)
+
+    def _stream(self, prompt: str, usage: dict):
+        with self.session.post(
+            f"{self.host}/api/generate",
+            json={"model": self.model, "prompt": prompt, "stream": True},
+            timeout=self.timeout,
+            stream=True,
+        ) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                payload = json.loads(line)
+                if payload.get("response"):
+                    yield payload["response"]
+                if payload.get("done"):
+                    usage.update(self._usage(payload))
+
+
+@register_backend("fake")
+class FakeBackend(LLMBackend):
+    """Deterministic offline backend for benchmarks, replays and local testing."""
+
+    def __init__(self, reply: str = None, delay: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.reply = reply or os.getenv(
+            "FAKE_LLM_REPLY",
+            "Dear customer,\n\nThank you for reaching out. Please find the resolution below.\n\n"
+            "Feel free to contact us\n\nBest Regards,\nUday Hiremath\nAI Expert",
+        )
+        self.delay = float(os.getenv("FAKE_LLM_DELAY", "0")) if delay is None else delay
+
+    def _generate(self, prompt: str):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.reply, {"input_tokens": len(prompt) // 4, "output_tokens": len(self.reply) // 4}
+
+    def _stream(self, prompt: str, usage: dict):
+        text, reported = self._generate(prompt)
+        for line in text.splitlines(keepends=True):
+            yield line
+        usage.update(reported)
+
+
+# ============================================
+# CONFIGURATION
+# ============================================
+_instances = {}
+_lock = threading.Lock()
+_pinned = {}
+
+
+def pin_env(**values):
+    """Set variables that the .env re-read below must not override (command-line flags)."""
+    _pinned.update({k: str(v) for k, v in values.items()})
+    os.environ.update(_pinned)
+
+
+def reload_env():
+    """Re-read .env so dashboard edits apply without a restart; pinned values still win."""
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+    os.environ.update(_pinned)
+
+
+def backend_name() -> str:
+    return os.getenv("LLM_BACKEND", DEFAULT_BACKEND).lower()
+
+
+def rate_limit_retries() -> int:
+    return int(os.getenv("LLM_RATE_LIMIT_RETRIES", "2"))
+
+
+def backend_settings(name: str) -> dict:
+    prefix = f"LLM_{name.upper()}_"
+    return {
+        "timeout": float(os.getenv(prefix + "TIMEOUT", "60")),
+        "max_concurrency": int(os.getenv(prefix + "CONCURRENCY", "4")),
+    }
+
+
+def get_backend(name: str = None) -> LLMBackend:
+    """Return the configured backend instance (created once per settings)."""
+    reload_env()
+    name = (name or backend_name()).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}'. Registered: {', '.join(sorted(BACKENDS))}")
+
+    settings = backend_settings(name)
+    key = (name, tuple(sorted(settings.items())))
+    with _lock:
+        if key not in _instances:
+            _instances[key] = BACKENDS[name](**settings)
+        return _instances[key]
+
+
+def backend_metrics() -> dict:
+    """Metrics of every backend instantiated in this process."""
+    with _lock:
+        return {name: backend.metrics.snapshot() for (name, _), backend in _instances.items()}
@@ -0,0 +1,376 @@
+"""
+Routing layer over llm_backends: latency budget, hedged requests,
+automatic fallback and per-backend circuit breakers.
+
+    LLM_BACKEND=gemini            primary backend
+    LLM_FALLBACKS=ollama          comma separated, tried in order
+    LLM_HEDGE_DELAY=8             seconds before a hedged request goes to the next backend
+    LLM_LATENCY_BUDGET=45         total seconds a ticket may wait for a reply
+    LLM_BREAKER_FAILURES=3        consecutive failures that open a breaker
+    LLM_BREAKER_RESET=60          seconds an open breaker waits before a trial call
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from llm_backends import backend_name, get_backend, reload_env
+from rate_limiter import Cancelled
+
+
+def estimate_usage(prompt: str, text: str) -> dict:
+    """Rough token counts (~4 characters per token) for a billed call that reported none."""
+    return {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self.probing = False
+        self.probe_started = 0.0
+
+    def ready(self) -> bool:
+        """Would allow() let a call through? Does not claim the trial call."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            if self.state == self.HALF_OPEN:
+                return not self._probe_in_flight()
+            return True
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                # Only one trial request at a time; everyone else waits for its verdict
+                if self._probe_in_flight():
+                    return False
+                self.probing = True
+                self.probe_started = time.monotonic()
+                return True
+            return self.state != self.OPEN
+
+    def _probe_in_flight(self) -> bool:
+        # A probe that never reported back (hung call) frees the slot after reset_timeout
+        return self.probing and time.monotonic() - self.probe_started < self.reset_timeout
+
+    def release(self):
+        """The trial call was abandoned before it reached the backend (e.g. cancelled)."""
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.probing = False
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": retry_in,
+                "last_error": self.last_error,
+            }
+
+
+class LLMRouter:
+    def __init__(self, backends: list, hedge_delay: float = 8.0, latency_budget: float = 45.0,
+                 failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.backends = backends
+        self.hedge_delay = hedge_delay
+        self.latency_budget = latency_budget
+        self.breakers = {name: breaker_for(name, failure_threshold, reset_timeout) for name in backends}
+
+    def available(self) -> list:
+        return [name for name in self.backends if self.breakers[name].ready()]
+
+    def _submit(self, queue: list, fn, prompt: str, cancel, pending: dict) -> bool:
+        """Start fn on the next backend in queue whose breaker admits the call."""
+        while queue:
+            name = queue.pop(0)
+            if self.breakers[name].allow():
+                pending[_pool.submit(fn, name, prompt, cancel)] = name
+                return True
+        return False
+
+    def _call(self, name: str, prompt: str, cancel=None):
+        breaker = self.breakers[name]
+        try:
+            response = get_backend(name).generate(prompt, cancel=cancel)
+        except Cancelled:
+            breaker.release()
+            raise  # the worker is stopping, not a backend failure
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        return response
+
+    @staticmethod
+    def _account_discarded(prompt: str, on_usage, future):
+        """Report a hedged reply that was not used (it is still billed)."""
+        if on_usage is None or future.cancelled() or future.exception() is not None:
+            return
+        response = future.result()
+        on_usage(response.backend, response.usage or estimate_usage(prompt, response.text), response.latency)
+
+    def generate(self, prompt: str, cancel=None, on_usage=None):
+        """
+        Return the first successful LLMResponse within the latency budget.
+        Setting `cancel` abandons calls still queued on the rate limiter.
+        on_usage(backend, usage, latency) is called for every other reply that
+        completes (hedge losers, replies after the budget), since those are
+        billed too.
+        """
+        queue = self.available()
+        if not queue:
+            raise RuntimeError("All LLM backends are unavailable (circuit breakers open)")
+
+        deadline = time.monotonic() + self.latency_budget
+        pending = {}
+        errors = []
+
+        def launch():
+            return self._submit(queue, self._call, prompt, cancel, pending)
+
+        if not launch():  # another caller took the trial call of a half-open breaker
+            raise RuntimeError("All LLM backends are unavailable (circuit breakers open)")
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Wake up after hedge_delay to hedge onto the next backend if still waiting
+                timeout = min(remaining, self.hedge_delay) if queue else remaining
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    if queue:
+                        launch()
+                    continue
+
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Cancelled:
+                        raise
+                    except Exception as e:
+                        errors.append(f"{name}: {e}")
+                        if queue and not pending:
+                            launch()  # immediate fallback on error
+                        continue
+                    # Any other reply finished in the same wait is accounted like a late one
+                    for other in done:
+                        if other in pending:
+                            pending.pop(other)
+                            self._account_discarded(prompt, on_usage, other)
+                    return response
+        finally:
+            for future in pending:
+                future.add_done_callback(partial(self._account_discarded, prompt, on_usage))
+
+        if pending:
+            raise TimeoutError(
+                f"No LLM reply within {self.latency_budget:g}s "
+                f"(waiting on {', '.join(pending.values())})"
+            )
+        raise RuntimeError("All LLM backends failed: " + "; ".join(errors))
+
+    def _open_stream(self, name: str, prompt: str, cancel=None):
+        """Start streaming from one backend and wait for its first chunk."""
+        breaker = self.breakers[name]
+        reported = {}
+        try:
+            chunks = get_backend(name).stream(prompt, usage=reported, cancel=cancel)
+            first = next(chunks, None)
+        except Cancelled:
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        return chunks, first, reported
+
+    @staticmethod
+    def _discard_stream(name: str, prompt: str, on_usage, future):
+        """Close a stream that lost the race (or answered after the budget) and report it."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        chunks, first, reported = future.result()
+        chunks.close()
+        if on_usage is not None:
+            # Backends report counts with the last chunk, which a closed stream never sends
+            on_usage(name, reported or estimate_usage(prompt, first or ""), None)
+
+    def stream(self, prompt: str, usage: dict = None, cancel=None, on_usage=None):
+        """
+        Stream from the first backend to produce output. The latency budget and
+        the hedged request apply to the wait for the first chunk, as in generate();
+        once a backend is streaming it is not interrupted. on_usage is called for
+        the streams that were started but not used, as in generate().
+        """
+        queue = self.available()
+        if not queue:
+            raise RuntimeError("All LLM backends are unavailable (circuit breakers open)")
+
+        deadline = time.monotonic() + self.latency_budget
+        pending = {}
+        errors = []
+        winner = None
+
+        def launch():
+            return self._submit(queue, self._open_stream, prompt, cancel, pending)
+
+        if not launch():  # another caller took the trial call of a half-open breaker
+            raise RuntimeError("All LLM backends are unavailable (circuit breakers open)")
+        try:
+            while pending and winner is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                timeout = min(remaining, self.hedge_delay) if queue else remaining
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    if queue:
+                        launch()
+                    continue
+
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Cancelled:
+                        raise
+                    except Exception as e:
+                        errors.append(f"{name}: {e}")
+                        if queue and not pending:
+                            launch()
+                        continue
+                    if winner is None:
+                        winner = (name, result)
+                    else:
+                        self._discard_stream(name, prompt, on_usage, future)
+        finally:
+            # Slower hedges keep running in the pool; close them once they answer
+            for future, name in pending.items():
+                future.add_done_callback(partial(self._discard_stream, name, prompt, on_usage))
+
+        if winner is None:
+            if pending:
+                raise TimeoutError(
+                    f"No LLM output within {self.latency_budget:g}s "
+                    f"(waiting on {', '.join(pending.values())})"
+                )
+            raise RuntimeError("All LLM backends failed: " + "; ".join(errors))
+
+        name, (chunks, first, reported) = winner
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except Exception as e:
+            self.breakers[name].record_failure(e)
+            raise
+        finally:
+            chunks.close()
+        if usage is not None:
+            usage.update(reported)
+            usage["backend"] = name
+
+    def status(self) -> dict:
+        return {name: self.breakers[name].snapshot() for name in self.backends}
+
+
+# ============================================
+# CONFIGURATION
+# ============================================
+_routers = {}
+_breakers = {}
+_lock = threading.Lock()
+# One pool for every router: get_router() builds a new router whenever .env changes,
+# and hedged calls may outlive the router that started them
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+def breaker_for(name: str, failure_threshold: int = 3, reset_timeout: float = 60.0) -> CircuitBreaker:
+    """One breaker per backend for the whole process, shared by every router."""
+    with _lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(failure_threshold, reset_timeout)
+        breaker.failure_threshold = failure_threshold
+        breaker.reset_timeout = reset_timeout
+        return breaker
+
+
+def router_backends() -> list:
+    names = [backend_name()]
+    for name in os.getenv("LLM_FALLBACKS", "").split(","):
+        name = name.strip().lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def get_router() -> LLMRouter:
+    """Router for the current configuration; breaker state survives between tickets."""
+    reload_env()
+    backends = router_backends()
+    settings = (
+        float(os.getenv("LLM_HEDGE_DELAY", "8")),
+        float(os.getenv("LLM_LATENCY_BUDGET", "45")),
+        int(os.getenv("LLM_BREAKER_FAILURES", "3")),
+        float(os.getenv("LLM_BREAKER_RESET", "60")),
+    )
+    key = (tuple(backends), settings)
+    with _lock:
+        router = _routers.get(key)
+    if router is None:
+        router = LLMRouter(backends, *settings)
+        with _lock:
+            router = _routers.setdefault(key, router)
+    return router
+
+
+def router_status() -> dict:
+    """Breaker state + backend metrics for every backend seen so far, for the dashboard."""
+    from llm_backends import backend_metrics
+
+    metrics = backend_metrics()
+    with _lock:
+        breakers = dict(_breakers)
+    status = {}
+    for name, breaker in breakers.items():
+        entry = dict(metrics.get(name, {}))
+        entry.update(breaker.snapshot())
+        status[name] = entry
+    return status
@@ -0,0 +1,107 @@
+"""
+Prompt construction for generate_email.
+
+Retrieved documents are rendered as one compact line each instead of the
+repr of a LangChain Document list, and related context is packed best-score
+first into a token budget. The static parts of the prompt are built once
+per (issue count, word limit) and reused.
+
+    PROMPT_TOKEN_BUDGET=300   max estimated tokens spent on related context
+"""
+import os
+from functools import lru_cache
+
+TEMPLATE = """Dear customer,
+
+issue number:
+
+issue:
+
+solution:
+
+Feel free to contact us
+
+Best Regards,
+Uday Hiremath
+AI Expert"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def format_record(record: dict) -> str:
+    """One compact line per issue: number, device, issue and solution only."""
+    number = record.get("issue_number")
+    device = record.get("device")
+    head = f"#{number}" if number is not None else "#?"
+    if device:
+        head += f" [{device}]"
+    if record.get("issue") or record.get("solution"):
+        return f"{head} {record.get('issue', '')} -> {record.get('solution', '')}"
+    return f"{head} {' '.join(record.get('text', '').split())}"
+
+
+@lru_cache(maxsize=32)
+def static_parts(known_issues: int, words: int) -> tuple:
+    """(header, footer) of the prompt; depends only on the issue count."""
+    if known_issues == 0:
+        header = "You are a tech support engineer. The customer's error code is unknown; the closest knowledge-base entries are:"
+        task = "mention issue number, issue and solution (descriptive), try to give one or more solutions"
+    elif known_issues == 1:
+        header = "You are a tech support engineer. Customer issue:"
+        task = "mention issue number, issue and solution (descriptive), try to give one or more solutions"
+    else:
+        header = f"You are a tech support engineer. The customer reported {known_issues} issues:"
+        task = "write ONE consolidated email, repeat the issue number / issue / solution block for each issue"
+    footer = f"Write a clean email: {task}, about {words} words, following this template:\n{TEMPLATE}"
+    return header, footer
+
+
+class PromptBuilder:
+    def __init__(self, token_budget: int = 300):
+        self.token_budget = token_budget
+
+    def pack(self, hits: list, exclude: set = None, budget: int = None) -> list:
+        """Highest-scoring unique context lines that fit in the token budget."""
+        budget = self.token_budget if budget is None else budget
+        exclude = set(exclude or ())
+        lines, used = [], 0
+        for row, score in sorted(hits, key=lambda hit: hit[1], reverse=True):
+            key = row.get("issue_number", row.get("text"))
+            if key in exclude:
+                continue
+            line = format_record(row)
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                continue
+            exclude.add(key)
+            lines.append(line)
+            used += cost
+        return lines
+
+    def build(self, records: list, hits: list) -> str:
+        """records: exact knowledge-base hits; hits: [(row, score), ...] from retrieval."""
+        words = 150 if len(records) <= 1 else 100 + 60 * len(records)
+        header, footer = static_parts(len(records), words)
+
+        issue_lines = [format_record(r) for r in records]
+        context = self.pack(hits, exclude={r.get("issue_number") for r in records})
+
+        parts = [header, *issue_lines]
+        if context:
+            parts.append("Related knowledge:" if records else "")
+            parts.extend(f"- {line}" for line in context)
+        parts.append(footer)
+        return "\n".join(p for p in parts if p)
+
+
+_builder = {}
+
+
+def get_prompt_builder() -> PromptBuilder:
+    budget = int(os.getenv("PROMPT_TOKEN_BUDGET", "300"))
+    if budget not in _builder:
+        _builder[budget] = PromptBuilder(budget)
+    return _builder[budget]
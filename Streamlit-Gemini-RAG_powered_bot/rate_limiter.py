@@ -0,0 +1,270 @@
+"""
+Client-side rate limiting for Gmail and LLM calls.
+
+One token bucket per (api, account). Callers queue on the bucket instead
+of failing; when several are waiting, lower priority numbers go first, so
+sends of in-flight tickets are not starved by new fetches. 429 /
+rate-limit responses push the bucket back by the server's Retry-After (or
+an exponential backoff) and the call is retried.
+
+    RATE_LIMITS=gmail=250/1,gemini=60/60    units per seconds for each api
+    LLM_RATE_LIMIT_RETRIES=2                 429 retries of one LLM call before it fails over
+
+Gmail quota is metered in units (list/get = 5, send = 100 per call).
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+
+SEND = 0
+GENERATE = 1
+FETCH = 2
+
+GMAIL_COSTS = {"list": 5, "get": 5, "send": 100}
+
+# How often a waiter with a cancel event re-checks it (seconds)
+CANCEL_CHECK = 0.5
+
+DEFAULT_LIMITS = {
+    "gmail": (250, 1.0),   # Gmail: 250 quota units per user per second
+    "gemini": (60, 60.0),  # requests per minute
+    "ollama": (120, 60.0),
+    "fake": (1000, 1.0),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._cond = threading.Condition()
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost: float = 1, priority: int = FETCH, timeout: float = None, cancel=None) -> bool:
+        """
+        Block until `cost` tokens are available and no higher-priority caller is
+        queued. False on timeout or when the `cancel` event is set.
+        """
+        cost = min(cost, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    at_head = self._waiters[0] == entry
+
+                    if at_head and now >= self.blocked_until and self.tokens >= cost:
+                        self.tokens -= cost
+                        return True
+
+                    if cancel is not None and cancel.is_set():
+                        return False
+
+                    wait = None
+                    if at_head:
+                        wait = max(self.blocked_until - now, (cost - self.tokens) / self.rate, 0.001)
+                    if cancel is not None:
+                        wait = CANCEL_CHECK if wait is None else min(wait, CANCEL_CHECK)
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def penalize(self, seconds: float):
+        """Server said slow down: nobody gets a token for `seconds`."""
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self._cond.notify_all()
+
+    def status(self) -> dict:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "tokens": round(self.tokens, 1),
+                "capacity": self.capacity,
+                "queued": len(self._waiters),
+                "blocked_for": max(0.0, self.blocked_until - time.monotonic()),
+            }
+
+
+def _status_code(exc: Exception):
+    resp = getattr(exc, "resp", None)  # googleapiclient HttpError
+    if resp is not None and getattr(resp, "status", None) is not None:
+        return getattr(resp, "status")
+    response = getattr(exc, "response", None)  # requests HTTPError
+    if response is not None and getattr(response, "status_code", None) is not None:
+        return response.status_code
+    code = getattr(exc, "code", None)  # google.api_core errors (generate_content)
+    return code if isinstance(code, (int, str)) else None
+
+
+def _is_rate_limited(exc: Exception) -> bool:
+    """429 status, or the structured quota reason Google APIs use for it."""
+    status = _status_code(exc)
+    if status is not None:
+        try:
+            return int(status) == 429
+        except (TypeError, ValueError):
+            pass
+    if type(exc).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    text = str(exc)
+    return "rateLimitExceeded" in text or "RESOURCE_EXHAUSTED" in text
+
+
+def _seconds(name: str, value: str):
+    """Delay in seconds from one quota header value."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        if name == "retry-after":
+            # Retry-After may be an HTTP date
+            from email.utils import parsedate_to_datetime
+
+            try:
+                return parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return None
+    if name == "x-ratelimit-reset":
+        # Some APIs send the reset moment (epoch seconds or ms) rather than a delay
+        if number > 1e12:
+            number = number / 1000.0 - time.time()
+        elif number > 1e9:
+            number -= time.time()
+    return number
+
+
+def _retry_after(exc: Exception):
+    """Seconds from Retry-After / X-RateLimit-Reset headers, if the error carries them."""
+    headers = getattr(exc, "resp", None) or getattr(getattr(exc, "response", None), "headers", None)
+    if not headers or not hasattr(headers, "items"):
+        return None
+    headers = {str(k).lower(): v for k, v in headers.items()}
+    for name in ("retry-after", "x-ratelimit-reset"):
+        value = headers.get(name)
+        if value:
+            seconds = _seconds(name, str(value).strip())
+            if seconds is not None:
+                return max(0.0, seconds)
+    return None
+
+
+class Cancelled(Exception):
+    """A queued call was abandoned because its cancel event was set."""
+
+
+class RateLimiter:
+    def __init__(self, limits: dict = None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, api: str, account: str = None) -> TokenBucket:
+        key = (api, account or "default")
+        with self._lock:
+            if key not in self._buckets:
+                units, seconds = self.limits.get(api, (10, 1.0))
+                self._buckets[key] = TokenBucket(units / seconds, units)
+            return self._buckets[key]
+
+    def acquire(self, api: str, account: str = None, cost: float = 1, priority: int = FETCH,
+                timeout: float = None, cancel=None) -> bool:
+        return self.bucket(api, account).acquire(cost, priority, timeout, cancel)
+
+    def backoff(self, api: str, error: Exception, attempt: int, account: str = None) -> float:
+        """Push the bucket back after a 429 (Retry-After or exponential backoff); returns the delay."""
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(60.0, 2.0 ** attempt)
+        self.bucket(api, account).penalize(delay)
+        return delay
+
+    def call(self, api: str, fn, account: str = None, cost: float = 1, priority: int = FETCH,
+             retries: int = 5, log=None, cancel=None):
+        """Run fn() under the limit; on 429 wait (Retry-After or backoff) and retry."""
+        bucket = self.bucket(api, account)
+        for attempt in range(retries + 1):
+            if not bucket.acquire(cost, priority, cancel=cancel):
+                raise Cancelled(f"{api} call cancelled while waiting for rate limit")
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= retries or not _is_rate_limited(e):
+                    raise
+                delay = self.backoff(api, e, attempt, account)
+                if log:
+                    log(f"⏳ {api} rate limited - retrying in {delay:.1f}s (attempt {attempt + 1}/{retries})")
+
+    def stream(self, api: str, open_stream, account: str = None, cost: float = 1, priority: int = FETCH,
+               retries: int = 5, log=None, cancel=None):
+        """call() for generators: a 429 before the first chunk is retried like in call()."""
+        bucket = self.bucket(api, account)
+        for attempt in range(retries + 1):
+            if not bucket.acquire(cost, priority, cancel=cancel):
+                raise Cancelled(f"{api} call cancelled while waiting for rate limit")
+            started = False
+            try:
+                for chunk in open_stream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or attempt >= retries or not _is_rate_limited(e):
+                    raise
+                delay = self.backoff(api, e, attempt, account)
+                if log:
+                    log(f"⏳ {api} rate limited - retrying in {delay:.1f}s (attempt {attempt + 1}/{retries})")
+
+    def status(self) -> dict:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {f"{api}:{account}": b.status() for (api, account), b in buckets.items()}
+
+
+def parse_limits(spec: str) -> dict:
+    """'gmail=250/1,gemini=60/60' -> {'gmail': (250.0, 1.0), 'gemini': (60.0, 60.0)}"""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        api, value = item.split("=", 1)
+        units, _, seconds = value.partition("/")
+        try:
+            limits[api.strip().lower()] = (float(units), float(seconds or 1))
+        except ValueError:
+            continue
+    return limits
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(parse_limits(os.getenv("RATE_LIMITS", "")))
+        return _limiter
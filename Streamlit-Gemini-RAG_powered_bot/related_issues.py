@@ -0,0 +1,107 @@
+"""
+Precomputed related issues for every known issue_number.
+
+build_index.py stores, next to the vector index, the top-k most similar
+issues of every issue (cosine over the index embeddings), tagged with the
+knowledge-base version (sha256 of the JSON) it was computed from. Tickets
+with a known error code then take their "related knowledge" from this table
+and never touch the embedding model; only tickets without a code run a live
+vector search.
+
+    RELATED_PRECOMPUTED=1     use the table when it matches the loaded knowledge base
+"""
+import json
+import os
+import threading
+
+NEIGHBORS_FILE = "neighbors.json"
+DEFAULT_NEIGHBORS = 5
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def compute_neighbors(matrix, rows: list, k: int = DEFAULT_NEIGHBORS, chunk: int = 1024) -> dict:
+    """{issue_number: [[related_issue_number, score], ...]} best first, self excluded."""
+    import numpy as np
+
+    numbers = [int(r["issue_number"]) for r in rows]
+    k = min(k, max(len(rows) - 1, 0))
+    neighbors = {}
+    if k == 0:
+        return {n: [] for n in numbers}
+
+    for start in range(0, len(rows), chunk):
+        scores = matrix[start:start + chunk] @ matrix.T  # rows are unit vectors
+        for offset in range(scores.shape[0]):
+            scores[offset, start + offset] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for offset, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[offset, candidates])]
+            neighbors[numbers[start + offset]] = [
+                [numbers[i], round(float(scores[offset, i]), 6)] for i in ordered
+            ]
+    return neighbors
+
+
+def write_neighbors(index_dir: str, neighbors: dict, kb_versions: list, model: str):
+    path = os.path.join(index_dir, NEIGHBORS_FILE)
+    payload = {
+        "kb_versions": kb_versions,
+        "model": model,
+        "k": max((len(v) for v in neighbors.values()), default=0),
+        "neighbors": {str(n): related for n, related in neighbors.items()},
+    }
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_neighbors(index_dir: str = None):
+    """Parsed neighbors file (cached by mtime), or None if it was never built."""
+    from vector_index import vector_index_dir
+
+    path = os.path.join(index_dir or vector_index_dir(), NEIGHBORS_FILE)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            payload["neighbors"] = {int(n): related for n, related in payload["neighbors"].items()}
+            cached = (mtime, payload)
+            _cache[path] = cached
+        return cached[1]
+
+
+def enabled() -> bool:
+    return os.getenv("RELATED_PRECOMPUTED", "1").lower() in ("1", "true", "yes")
+
+
+def related_hits(issue_numbers: list, k: int = 2, knowledge_base=None, index_dir: str = None):
+    """
+    [(record, score), ...] related to the given issues, k per issue, or None
+    when no table exists for the current knowledge-base version (caller
+    falls back to live search). index_dir: the snapshot's index directory.
+    """
+    from knowledge_base import get_knowledge_base
+
+    if not enabled():
+        return None
+    knowledge_base = knowledge_base or get_knowledge_base()
+    table = load_neighbors(index_dir)
+    if table is None or knowledge_base.version not in table.get("kb_versions", []):
+        return None
+
+    hits = []
+    for number in issue_numbers:
+        related = table["neighbors"].get(int(number))
+        if related is None:
+            return None
+        for neighbor, score in related[:k]:
+            record = knowledge_base.get(neighbor)
+            if record is not None:
+                hits.append((record, score))
+    return hits
@@ -0,0 +1,264 @@
+"""
+Offline replay of historical mail through the reply pipeline.
+
+    python replay_corpus.py archive.mbox --out replay_out
+    python replay_corpus.py mails/ --workers 8 --backend fake --limit 2000
+
+Messages are streamed from an mbox file or a directory of .eml files and go
+through the live worker's own stage functions - classify_message (subject /
+spam filters), classify_stage (error codes) and generate_stage (template or
+LLM, streamed when STREAM_REPLIES=1) - but replies are written to files
+instead of being sent. LLM usage is recorded in <out>/usage.sqlite3 under the
+mailbox "replay", not in the live USAGE_DB. Messages are
+processed in parallel; at the end throughput and the classification /
+retrieval outcomes are printed and saved.
+
+Output directory:
+    replies/<n>.txt     one generated reply per support ticket
+    results.jsonl       one line per message (category, codes, top retrieval hit, timings)
+    summary.json        counts, throughput, latency percentiles and LLM usage
+    usage.sqlite3       token / cost records of this replay (usage_store.py)
+"""
+import argparse
+import email
+import json
+import mailbox
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email import policy
+from email.utils import parsedate_to_datetime
+
+
+def latency_stats(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+    return {"mean": sum(ordered) / len(ordered), "p50": pick(50), "p95": pick(95), "max": ordered[-1]}
+
+
+# ============================================
+# CORPUS READERS
+# ============================================
+def _parse_file(f):
+    return email.message_from_binary_file(f, policy=policy.default)
+
+
+def iter_corpus(path: str):
+    """Yield (source, EmailMessage) lazily from an mbox file or a .eml directory."""
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.lower().endswith(".eml"):
+                    full = os.path.join(root, name)
+                    with open(full, "rb") as f:
+                        yield full, _parse_file(f)
+    else:
+        box = mailbox.mbox(path, factory=_parse_file, create=False)
+        for key, msg in box.iteritems():
+            yield f"{path}#{key}", msg
+
+
+def message_fields(msg) -> dict:
+    """Same fields as email_worker.parse_message, from a stdlib email message."""
+    from email_worker import get_clean_text
+
+    part = msg.get_body(preferencelist=("plain", "html"))
+    try:
+        raw_body = part.get_content() if part is not None else ""
+    except (LookupError, UnicodeDecodeError):
+        raw_body = part.get_payload(decode=True).decode("utf-8", errors="ignore")
+
+    try:
+        received = parsedate_to_datetime(msg["Date"]).timestamp()
+    except (TypeError, ValueError):
+        received = None
+
+    return {
+        "sender": str(msg.get("From", "(unknown)")),
+        "subject": str(msg.get("Subject", "(unknown)")),
+        "body": get_clean_text(raw_body) or "(No body found)",
+        "received": received,
+    }
+
+
+# ============================================
+# PIPELINE (same steps as the live worker)
+# ============================================
+def replay_message(n: int, source: str, msg, out_dir: str, check_retrieval: bool) -> dict:
+    """Run one message through email_worker's own stages; the send stage is a file write."""
+    from email_worker import classify_message, classify_stage, generate_stage, skip_reason
+    from retrieval import retrieve
+
+    result = {"n": n, "source": source}
+    start = time.perf_counter()
+    try:
+        ticket = dict(message_fields(msg), msg_id=source)
+        result["subject"] = ticket["subject"]
+
+        if not classify_message(ticket):
+            result["category"] = "skipped: " + skip_reason(ticket)
+            return result
+
+        found = classify_stage(ticket)
+        result["codes"] = ticket.get("codes", [])
+
+        if check_retrieval:
+            t = time.perf_counter()
+            hits = retrieve(ticket["body"], k=1)
+            result["retrieval_latency"] = time.perf_counter() - t
+            if hits:
+                row, score = hits[0]
+                result["top_hit"] = row.get("issue_number")
+                result["top_score"] = round(float(score), 4)
+                if result["codes"]:
+                    result["top_hit_matches_code"] = row.get("issue_number") in result["codes"]
+
+        if not found:
+            result["category"] = "no code"
+            return result
+
+        t = time.perf_counter()
+        generate_stage(ticket)
+        result["category"] = ticket["reply_source"]
+        result["generation_latency"] = time.perf_counter() - t
+
+        reply_path = os.path.join(out_dir, "replies", f"{n}.txt")
+        with open(reply_path, "w", encoding="utf-8") as f:
+            f.write(f"To: {ticket['sender']}\nSubject: Reply for error\n\n{ticket['reply']}")
+        result["reply"] = reply_path
+    except Exception as e:
+        result["category"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["latency"] = time.perf_counter() - start
+    return result
+
+
+def replay(path: str, out_dir: str, workers: int = 4, limit: int = None, check_retrieval: bool = True) -> dict:
+    from email_worker import controller
+    from llm_backends import pin_env
+    from usage_store import usage_by_mailbox
+
+    os.makedirs(os.path.join(out_dir, "replies"), exist_ok=True)
+    results_path = os.path.join(out_dir, "results.jsonl")
+
+    # LLM usage goes to the replay's own database under its own mailbox, never the live one
+    usage_db = os.path.join(out_dir, "usage.sqlite3")
+    if os.path.exists(usage_db):
+        os.remove(usage_db)
+    pin_env(USAGE_DB=usage_db, AUTOMATION_GMAIL="replay")
+    controller.console = False  # the per-ticket worker log would drown the progress lines
+
+    categories = Counter()
+    latencies, generation, retrieval = [], [], []
+    code_counts = Counter()
+    retrieval_agreement = Counter()
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+    processed = 0
+
+    with open(results_path, "w", encoding="utf-8") as results_file, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as pool:
+
+        def collect(future):
+            nonlocal processed
+            result = future.result()
+            with write_lock:
+                processed += 1
+                results_file.write(json.dumps(result) + "\n")
+                categories[result["category"]] += 1
+                latencies.append(result["latency"])
+                if "codes" in result:
+                    code_counts[min(len(result["codes"]), 3)] += 1
+                if "generation_latency" in result:
+                    generation.append(result["generation_latency"])
+                if "retrieval_latency" in result:
+                    retrieval.append(result["retrieval_latency"])
+                if "top_hit_matches_code" in result:
+                    retrieval_agreement[result["top_hit_matches_code"]] += 1
+                if processed % 100 == 0:
+                    rate = processed / (time.perf_counter() - start)
+                    print(f"... {processed} messages ({rate:.1f}/s)")
+
+        # Bounded in-flight window so the corpus is streamed, not loaded
+        in_flight = set()
+        for n, (source, msg) in enumerate(iter_corpus(path)):
+            if limit is not None and n >= limit:
+                break
+            in_flight.add(pool.submit(replay_message, n, source, msg, out_dir, check_retrieval))
+            if len(in_flight) >= workers * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+        for future in wait(in_flight).done:
+            collect(future)
+
+    elapsed = time.perf_counter() - start
+    agreed = retrieval_agreement[True]
+    checked = agreed + retrieval_agreement[False]
+    summary = {
+        "corpus": path,
+        "messages": processed,
+        "seconds": elapsed,
+        "throughput_per_s": processed / elapsed if elapsed else 0.0,
+        "workers": workers,
+        "categories": dict(categories),
+        "codes_per_ticket": {("3+" if k == 3 else str(k)): v for k, v in sorted(code_counts.items())},
+        "retrieval_top1_matches_code": (agreed / checked) if checked else None,
+        "latency": latency_stats(latencies),
+        "generation_latency": latency_stats(generation),
+        "retrieval_latency": latency_stats(retrieval),
+        "llm_usage": usage_by_mailbox(path=usage_db),
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary: dict):
+    print()
+    print(f"messages       {summary['messages']} in {summary['seconds']:.1f}s "
+          f"({summary['throughput_per_s']:.1f} msg/s, {summary['workers']} workers)")
+    for category, count in sorted(summary["categories"].items(), key=lambda item: -item[1]):
+        print(f"  {category:<28} {count}")
+    print(f"codes/ticket   {summary['codes_per_ticket']}")
+    if summary["retrieval_top1_matches_code"] is not None:
+        print(f"retrieval top-1 == extracted code: {summary['retrieval_top1_matches_code']:.1%}")
+    for key in ("latency", "generation_latency", "retrieval_latency"):
+        stats = summary[key]
+        if stats:
+            print(f"{key:<20} mean {stats['mean'] * 1000:7.1f} ms   p50 {stats['p50'] * 1000:7.1f} ms   "
+                  f"p95 {stats['p95'] * 1000:7.1f} ms")
+    for row in summary["llm_usage"]:
+        print(f"llm {row['backend']:<16} {row['calls']} calls, {row['input_tokens'] or 0} in / "
+              f"{row['output_tokens'] or 0} out tokens, ${row['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="mbox file or directory of .eml files")
+    parser.add_argument("--out", default="replay_out", help="output directory (default: replay_out)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many messages")
+    parser.add_argument("--backend", default=None,
+                        help="LLM backend to use (e.g. fake), overriding LLM_BACKEND from the environment and .env; "
+                             "fallbacks are disabled")
+    parser.add_argument("--no-retrieval-check", action="store_true",
+                        help="skip the extra top-1 retrieval per ticket")
+    args = parser.parse_args()
+
+    if args.backend:
+        from llm_backends import pin_env
+
+        pin_env(LLM_BACKEND=args.backend, LLM_FALLBACKS="")
+
+    summary = replay(args.corpus, args.out, args.workers, args.limit, not args.no_retrieval_check)
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
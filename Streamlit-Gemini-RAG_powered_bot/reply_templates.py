@@ -0,0 +1,58 @@
+"""
+Deterministic reply renderer for tickets whose issue_number is an exact
+knowledge-base hit. Formatting a record takes microseconds and costs no
+API call, so the LLM is only used for ambiguous / RAG-fallback tickets.
+
+    REPLY_MODE=llm         always ask the LLM (default)
+    REPLY_MODE=template    render exact hits from the template, LLM otherwise
+    REPLY_VARIANTS=1       rotate between a few phrasings of the opening line
+"""
+import os
+import random
+
+REPLY_TEMPLATE = """Dear customer,
+
+{opening}
+
+{issues}
+Feel free to contact us
+
+Best Regards,
+Uday Hiremath
+AI Expert
+"""
+
+ISSUE_BLOCK = """Issue number: {issue_number}
+
+Issue: {issue}
+
+Solution: {solution}
+"""
+
+OPENINGS = [
+    "Thank you for contacting tech support. We have identified the issue you reported.",
+    "Thanks for reaching out. Here is the resolution for the error you are seeing.",
+    "We received your support request and found a matching known issue.",
+]
+
+
+def reply_mode() -> str:
+    return os.getenv("REPLY_MODE", "llm").lower()
+
+
+def render_reply(records, variants: bool = None) -> str:
+    """Fill the fixed reply template straight from one or more knowledge-base records."""
+    if isinstance(records, dict):
+        records = [records]
+    if variants is None:
+        variants = os.getenv("REPLY_VARIANTS", "0").lower() in ("1", "true", "yes")
+    opening = random.choice(OPENINGS) if variants else OPENINGS[0]
+    issues = "\n".join(
+        ISSUE_BLOCK.format(
+            issue_number=record.get("issue_number", ""),
+            issue=record.get("issue", ""),
+            solution=record.get("solution", ""),
+        )
+        for record in records
+    )
+    return REPLY_TEMPLATE.format(opening=opening, issues=issues)
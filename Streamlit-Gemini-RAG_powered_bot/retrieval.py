@@ -0,0 +1,232 @@
+"""
+Retrieval front-end used by generate_email.
+
+RETRIEVAL_BACKEND selects where context comes from:
+    chroma  - langchain Chroma store (default)
+    numpy   - memory-mapped dense index (vector_index.py)
+    hybrid  - BM25 + dense index with score fusion; confident lexical
+              matches short-circuit so the embedding model is not needed
+"""
+import os
+import threading
+
+from embeddings import embedding_model_name, get_embedding_model
+from lexical_index import BM25Index
+
+DEFAULT_BACKEND = "chroma"
+
+
+def retrieval_backend() -> str:
+    return os.getenv("RETRIEVAL_BACKEND", DEFAULT_BACKEND).lower()
+
+
+class HybridRetriever:
+    def __init__(self, index, alpha: float = 0.5, candidates: int = 20,
+                 lexical_min_score: float = 15.0, lexical_margin: float = 0.25, embedding_model=None):
+        self.index = index
+        self.embedding_model = embedding_model  # None -> the process-wide model
+        self.bm25 = BM25Index([row["text"] for row in index.rows])
+        self.alpha = alpha  # weight of the dense score in the fused score
+        self.candidates = candidates
+        self.lexical_min_score = lexical_min_score
+        self.lexical_margin = lexical_margin
+        self.last_mode = None
+
+    @classmethod
+    def from_env(cls, index, embedding_model=None):
+        return cls(
+            index,
+            embedding_model=embedding_model,
+            alpha=float(os.getenv("HYBRID_ALPHA", "0.5")),
+            lexical_min_score=float(os.getenv("LEXICAL_MIN_SCORE", "15.0")),
+            lexical_margin=float(os.getenv("LEXICAL_MARGIN", "0.25")),
+        )
+
+    def model(self):
+        return self.embedding_model or get_embedding_model()
+
+    def lexical_confident(self, lexical: list) -> bool:
+        """True when the best BM25 hit is strong and clearly ahead of the runner-up."""
+        if not lexical:
+            return False
+        top = lexical[0][1]
+        second = lexical[1][1] if len(lexical) > 1 else 0.0
+        return top >= self.lexical_min_score and (top - second) / top >= self.lexical_margin
+
+    def search_ids(self, query: str, k: int = 2) -> list:
+        """Return [(row_id, score), ...] best first."""
+        lexical = self.bm25.search(query, max(k, self.candidates))
+
+        if self.lexical_confident(lexical):
+            self.last_mode = "lexical"
+            top = lexical[0][1]
+            return [(i, s / top) for i, s in lexical[:k]]
+
+        self.last_mode = "hybrid"
+        vector = self.model().embed_query(query)
+        dense = dict(self.index.search_ids_by_vector(vector, max(k, self.candidates)))
+        return self._fuse(vector, dense, lexical)[:k]
+
+    def _fuse(self, vector, dense: dict, lexical: list) -> list:
+        """Weighted sum of cosine and max-normalized BM25 scores, best first."""
+        lex = dict(lexical)
+        missing = [i for i in lex if i not in dense]
+        dense.update(zip(missing, self.index.score_ids(vector, missing)))
+
+        top_lex = lexical[0][1] if lexical else 0.0
+        fused = {
+            i: self.alpha * d + (1.0 - self.alpha) * (lex.get(i, 0.0) / top_lex if top_lex else 0.0)
+            for i, d in dense.items()
+        }
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+    def search(self, query: str, k: int = 2) -> list:
+        """Return [(row, score), ...] best first."""
+        return [(self.index.rows[i], s) for i, s in self.search_ids(query, k)]
+
+    def search_many(self, queries: list, k: int = 2) -> list:
+        """Batched search; queries that need the dense index share one embedding call."""
+        results = [None] * len(queries)
+        dense_queries = []
+        for n, query in enumerate(queries):
+            lexical = self.bm25.search(query, max(k, self.candidates))
+            if self.lexical_confident(lexical):
+                top = lexical[0][1]
+                results[n] = [(self.index.rows[i], s / top) for i, s in lexical[:k]]
+            else:
+                dense_queries.append((n, lexical))
+
+        if dense_queries:
+            vectors = self.model().embed_documents([queries[n] for n, _ in dense_queries])
+            dense_hits = self.index.search_ids_by_vectors(vectors, max(k, self.candidates))
+            for (n, lexical), vector, hits in zip(dense_queries, vectors, dense_hits):
+                fused = self._fuse(vector, dict(hits), lexical)
+                results[n] = [(self.index.rows[i], s) for i, s in fused[:k]]
+        return results
+
+
+# ============================================
+# PROCESS-WIDE RETRIEVERS
+# ============================================
+_chroma = {}
+_lock = threading.Lock()
+
+
+def _ensure_chroma_model(chroma_dir: str, model_name: str):
+    """
+    Refuse a Chroma store embedded with another model (or without a record):
+    the store is tracked in git, so re-embedding it is left to the operator.
+    """
+    from build_index import chroma_model
+
+    recorded = chroma_model(chroma_dir)
+    if recorded == model_name:
+        return
+    message = (
+        f"Chroma store {chroma_dir} was embedded with {recorded or 'an unrecorded model'}, "
+        f"not EMBEDDING_MODEL={model_name}. Re-embed it with "
+        f"`python build_index.py --chroma-dir {chroma_dir}` (or set EMBEDDING_MODEL back)."
+    )
+    print(f"❌ {message}")
+    raise RuntimeError(message)
+
+
+def get_chroma(model_name: str = None, chroma_dir: str = None):
+    """
+    The langchain Chroma store (default: CHROMA_DIR with EMBEDDING_MODEL). Its
+    collection must have been embedded with that model (recorded by
+    build_index.sync_chroma); otherwise query and document vectors would not
+    match, so a RuntimeError is raised instead.
+    """
+    model_name = model_name or embedding_model_name()
+    chroma_dir = chroma_dir or os.getenv("CHROMA_DIR", "./chroma_langchain_db")
+    key = (chroma_dir, model_name)
+    with _lock:
+        if key not in _chroma:
+            from langchain_community.vectorstores import Chroma
+
+            _ensure_chroma_model(chroma_dir, model_name)
+            _chroma[key] = Chroma(
+                persist_directory=chroma_dir,
+                embedding_function=get_embedding_model(model_name),
+            )
+        return _chroma[key]
+
+
+def get_hybrid_retriever() -> HybridRetriever:
+    """Hybrid retriever of the current knowledge-base snapshot."""
+    from kb_manager import current_snapshot
+
+    return current_snapshot().retriever()
+
+
+def _snapshot(snapshot):
+    if snapshot is not None:
+        return snapshot
+    from kb_manager import current_snapshot
+
+    return current_snapshot()
+
+
+def _chroma_row(text: str, metadata: dict, knowledge_base) -> dict:
+    """Knowledge-base record behind a Chroma document (falls back to the raw text)."""
+    record = knowledge_base.get((metadata or {}).get("issue_number"))
+    return dict(record, text=text) if record else dict(metadata or {}, text=text)
+
+
+def _chroma_search(vectors: list, k: int, knowledge_base, store=None) -> list:
+    """
+    One Chroma query for all vectors (store: default get_chroma()). Scores are
+    cosine similarity (1 - l2/2 on unit vectors), the same scale as the numpy
+    index, so RETRIEVAL_MODE=threshold means the same thing for every backend
+    and for one or many queries.
+    """
+    result = (store if store is not None else get_chroma())._collection.query(query_embeddings=vectors, n_results=k)
+    return [
+        [
+            (_chroma_row(text, metadata, knowledge_base), 1.0 - float(distance) / 2.0)
+            for text, metadata, distance in zip(texts, metadatas, distances)
+        ]
+        for texts, metadatas, distances in zip(
+            result["documents"], result["metadatas"], result["distances"]
+        )
+    ]
+
+
+def retrieve(query: str, k: int = 2, snapshot=None) -> list:
+    """
+    [(row, score), ...] context for the prompt, using the configured backend.
+    snapshot: the ticket's kb_manager snapshot (default: the current one).
+    """
+    backend = retrieval_backend()
+    snapshot = _snapshot(snapshot)
+
+    if backend == "hybrid":
+        return snapshot.retriever().search(query, k)
+
+    if backend == "numpy":
+        return snapshot.vector_index().search(query, get_embedding_model(), k)
+
+    return _chroma_search([get_embedding_model().embed_query(query)], k, snapshot.knowledge_base)[0]
+
+
+def retrieve_many(queries: list, k: int = 2, snapshot=None) -> list:
+    """One [(row, score), ...] list per query, embedding all queries in a single batch."""
+    if not queries:
+        return []
+    backend = retrieval_backend()
+    snapshot = _snapshot(snapshot)
+
+    if backend == "hybrid":
+        return snapshot.retriever().search_many(queries, k)
+
+    vectors = get_embedding_model().embed_documents(queries)
+
+    if backend == "numpy":
+        index = snapshot.vector_index()
+        return [
+            [(index.rows[i], score) for i, score in hits]
+            for hits in index.search_ids_by_vectors(vectors, k)
+        ]
+
+    return _chroma_search(vectors, k, snapshot.knowledge_base)
@@ -0,0 +1,49 @@
+"""
+When to run similarity search for a ticket, and which hits to keep.
+
+    RETRIEVAL_MODE=always        related context for every ticket (default)
+    RETRIEVAL_MODE=on_miss       only when the issue_number lookup found nothing
+    RETRIEVAL_MODE=threshold     known-code tickets keep related context only if
+                                 the best hit scores >= RETRIEVAL_THRESHOLD
+    RETRIEVAL_THRESHOLD=0.6
+    RETRIEVAL_MIN_SCORE=0.3      hits below this score are always dropped
+
+Scores are cosine similarity for chroma and numpy (the fused score for hybrid),
+the same scale for single- and multi-issue tickets.
+"""
+import os
+
+MODES = ("always", "on_miss", "threshold")
+
+
+class RetrievalPolicy:
+    def __init__(self, mode: str = "always", threshold: float = 0.6, min_score: float = 0.3):
+        if mode not in MODES:
+            raise ValueError(f"Unknown RETRIEVAL_MODE '{mode}'. Use one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.threshold = threshold
+        self.min_score = min_score
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv("RETRIEVAL_MODE", "always").lower(),
+            threshold=float(os.getenv("RETRIEVAL_THRESHOLD", "0.6")),
+            min_score=float(os.getenv("RETRIEVAL_MIN_SCORE", "0.3")),
+        )
+
+    def should_retrieve(self, records: list) -> bool:
+        """False when the structured lookup is decisive and no search is wanted."""
+        return not (self.mode == "on_miss" and records)
+
+    def filter(self, hits: list, records: list) -> list:
+        """Drop hits below the cutoff; in threshold mode drop all of them unless the best is good enough."""
+        kept = [(row, score) for row, score in hits if score >= self.min_score]
+        if self.mode == "threshold" and records and kept:
+            if max(score for _, score in kept) < self.threshold:
+                return []
+        return kept
+
+
+def get_retrieval_policy() -> RetrievalPolicy:
+    return RetrievalPolicy.from_env()
@@ -0,0 +1,195 @@
+"""
+Persistent retry queue and dead-letter table for failed tickets.
+
+A ticket moves through three stages: fetch -> generate -> send. When a stage
+raises, the ticket is stored with everything it has so far (sender, body,
+reply...) and retried later from that stage, with exponential backoff. A
+ticket that already has its reply and only failed to send is therefore not
+sent to the LLM again. After RETRY_MAX_ATTEMPTS failures it moves to the
+dead-letter table, where the dashboard can inspect and replay it.
+
+    RETRY_DB=tickets.sqlite3
+    RETRY_MAX_ATTEMPTS=5
+    RETRY_BASE_DELAY=30      seconds before the first retry, doubled each time
+    RETRY_MAX_DELAY=3600
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+FETCH = "fetch"
+GENERATE = "generate"
+SEND = "send"
+STAGES = (FETCH, GENERATE, SEND)
+
+_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS retry_queue (
+    msg_id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    payload TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_retry_due ON retry_queue (next_attempt);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    msg_id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    payload TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+def retry_db_path() -> str:
+    return os.getenv("RETRY_DB", "tickets.sqlite3")
+
+
+def max_attempts() -> int:
+    return int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+
+
+def backoff(attempts: int) -> float:
+    """Delay before retry number `attempts` (1-based)."""
+    base = float(os.getenv("RETRY_BASE_DELAY", "30"))
+    cap = float(os.getenv("RETRY_MAX_DELAY", "3600"))
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+@contextmanager
+def _connect(path: str = None):
+    conn = sqlite3.connect(path or retry_db_path(), timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def new_ticket(msg_id: str) -> dict:
+    return {"msg_id": msg_id, "stage": FETCH, "attempts": 0}
+
+
+def _ticket(row) -> dict:
+    ticket = json.loads(row["payload"])
+    ticket.update(msg_id=row["msg_id"], stage=row["stage"], attempts=row["attempts"])
+    return ticket
+
+
+def _payload(ticket: dict) -> str:
+    return json.dumps({k: v for k, v in ticket.items() if k not in ("msg_id", "stage", "attempts")})
+
+
+def schedule_retry(ticket: dict, error: str, path: str = None) -> dict:
+    """
+    Record a failure of `ticket` at its current stage.
+    Returns {"dead": bool, "attempts": n, "delay": seconds}.
+    """
+    attempts = int(ticket.get("attempts", 0)) + 1
+    ticket["attempts"] = attempts
+    now = time.time()
+    with _lock, _connect(path) as conn:
+        if attempts >= max_attempts():
+            conn.execute("DELETE FROM retry_queue WHERE msg_id = ?", (ticket["msg_id"],))
+            conn.execute(
+                "INSERT OR REPLACE INTO dead_letter (msg_id, stage, attempts, last_error, payload, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (ticket["msg_id"], ticket["stage"], attempts, error, _payload(ticket), now),
+            )
+            return {"dead": True, "attempts": attempts, "delay": None}
+
+        delay = backoff(attempts)
+        conn.execute(
+            "INSERT OR REPLACE INTO retry_queue (msg_id, stage, attempts, next_attempt, last_error, payload, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ticket["msg_id"], ticket["stage"], attempts, now + delay, error, _payload(ticket), now),
+        )
+    return {"dead": False, "attempts": attempts, "delay": delay}
+
+
+def defer(ticket: dict, path: str = None):
+    """Store a ticket that was interrupted (not failed): due now, attempts unchanged."""
+    now = time.time()
+    with _lock, _connect(path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO retry_queue (msg_id, stage, attempts, next_attempt, last_error, payload, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ticket["msg_id"], ticket["stage"], int(ticket.get("attempts", 0)), now, "interrupted", _payload(ticket), now),
+        )
+
+
+def due_tickets(limit: int = 10, path: str = None) -> list:
+    """Tickets whose backoff has expired, oldest due first."""
+    with _connect(path) as conn:
+        rows = conn.execute(
+            "SELECT * FROM retry_queue WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+    return [_ticket(r) for r in rows]
+
+
+def complete(msg_id: str, path: str = None):
+    """Ticket finished (sent or deliberately skipped) - forget it."""
+    with _lock, _connect(path) as conn:
+        conn.execute("DELETE FROM retry_queue WHERE msg_id = ?", (msg_id,))
+
+
+def is_tracked(msg_id: str, path: str = None) -> bool:
+    """True if the ticket is waiting for a retry or parked as a dead letter."""
+    with _connect(path) as conn:
+        return conn.execute(
+            "SELECT 1 FROM retry_queue WHERE msg_id = ? UNION SELECT 1 FROM dead_letter WHERE msg_id = ?",
+            (msg_id, msg_id),
+        ).fetchone() is not None
+
+
+def pending(path: str = None) -> list:
+    with _connect(path) as conn:
+        rows = conn.execute(
+            "SELECT msg_id, stage, attempts, next_attempt, last_error FROM retry_queue ORDER BY next_attempt"
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def dead_letters(limit: int = 100, path: str = None) -> list:
+    with _connect(path) as conn:
+        rows = conn.execute("SELECT * FROM dead_letter ORDER BY failed_at DESC LIMIT ?", (limit,)).fetchall()
+    letters = []
+    for row in rows:
+        ticket = json.loads(row["payload"])
+        letters.append({
+            "msg_id": row["msg_id"],
+            "stage": row["stage"],
+            "attempts": row["attempts"],
+            "failed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["failed_at"])),
+            "sender": ticket.get("sender"),
+            "subject": ticket.get("subject"),
+            "last_error": row["last_error"],
+        })
+    return letters
+
+
+def replay(msg_id: str, path: str = None) -> bool:
+    """Move a dead letter back into the retry queue, due now, attempts reset."""
+    now = time.time()
+    with _lock, _connect(path) as conn:
+        row = conn.execute("SELECT * FROM dead_letter WHERE msg_id = ?", (msg_id,)).fetchone()
+        if row is None:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO retry_queue (msg_id, stage, attempts, next_attempt, last_error, payload, updated) "
+            "VALUES (?, ?, 0, ?, ?, ?, ?)",
+            (msg_id, row["stage"], now, row["last_error"], row["payload"], now),
+        )
+        conn.execute("DELETE FROM dead_letter WHERE msg_id = ?", (msg_id,))
+    return True
@@ -0,0 +1,139 @@
+"""
+Startup profile for the bot.
+
+    python startup_profile.py imports       # cold import time of every module, one fresh interpreter each
+    python startup_profile.py cold-start    # time-to-first-reply of a fresh process
+
+Both commands run the measured code in a separate interpreter so nothing is
+already cached in sys.modules. The cold-start run pushes one sample ticket
+through error-code extraction, retrieval and generation; it uses the fake
+LLM backend unless --backend is given (pinned, so .env cannot override it),
+so it measures the bot and not the network. Its usage rows go to a temporary
+database, not USAGE_DB. Inside the container:
+
+    docker run --rm rag-support-app python startup_profile.py cold-start
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Modules the worker may pull in, heaviest first in a typical install
+HEAVY_MODULES = [
+    "sentence_transformers",
+    "langchain_community.embeddings",
+    "langchain_community.vectorstores",
+    "google.generativeai",
+    "pandas",
+    "numpy",
+    "googleapiclient.discovery",
+    "google_auth_oauthlib.flow",
+    "streamlit",
+    "requests",
+]
+
+# Project modules imported by app.py / email_worker.py at startup
+APP_MODULES = [
+    "email_worker",
+    "llm_router",
+    "retrieval",
+    "vector_index",
+]
+
+SAMPLE_BODY = "Hello team, we are seeing error 100104 on the intellipod, bias voltage out of spec on Ch 1."
+
+IMPORT_SNIPPET = """
+import importlib, json, sys, time
+start = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[1])
+    print(json.dumps({"seconds": time.perf_counter() - start}))
+except Exception as e:
+    print(json.dumps({"error": f"{type(e).__name__}: {e}"}))
+"""
+
+COLD_START_SNIPPET = """
+import json, os, sys, tempfile, time
+t0 = time.perf_counter()
+from email_worker import error_codes_getter
+from gemini_llm_response import run_generator
+from llm_backends import pin_env
+from usage_store import usage_by_day
+t_import = time.perf_counter()
+# .env is re-read on every get_backend(): pin the backend so it cannot switch to a paid one,
+# and keep the usage rows out of the live USAGE_DB
+usage_db = os.path.join(tempfile.mkdtemp(), "usage.sqlite3")
+pin_env(LLM_BACKEND=sys.argv[2], LLM_FALLBACKS="", USAGE_DB=usage_db)
+codes = error_codes_getter(sys.argv[1])
+reply = run_generator.generate_email(codes, sys.argv[1])
+t_reply = time.perf_counter()
+reply = run_generator.generate_email(codes, sys.argv[1])
+t_second = time.perf_counter()
+print(json.dumps({
+    "import": t_import - t0,
+    "first_reply": t_reply - t_import,
+    "second_reply": t_second - t_reply,
+    "codes": codes,
+    "served_by": sorted({row["backend"] for row in usage_by_day(path=usage_db)}),
+}))
+"""
+
+
+def run_snippet(snippet: str, *args: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", snippet, *args],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    lines = out.stdout.strip().splitlines()
+    if out.returncode != 0 or not lines:
+        return {"error": (out.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(lines[-1])
+
+
+def profile_imports(modules: list) -> list:
+    rows = []
+    for module in modules:
+        result = run_snippet(IMPORT_SNIPPET, module)
+        rows.append((module, result))
+        if "error" in result:
+            print(f"{module:<36} {'-':>9}   {result['error']}")
+        else:
+            print(f"{module:<36} {result['seconds'] * 1000:7.0f} ms")
+    return rows
+
+
+def cold_start(backend: str) -> dict:
+    start = time.perf_counter()
+    result = run_snippet(COLD_START_SNIPPET, SAMPLE_BODY, backend)
+    wall = time.perf_counter() - start
+    if "error" in result:
+        print(f"cold start failed: {result['error']}")
+        return result
+
+    result["process_wall"] = wall
+    served = ", ".join(result["served_by"]) or "none (template reply)"
+    print(f"backend              {backend} requested, served by {served}")
+    print(f"import pipeline      {result['import'] * 1000:8.0f} ms")
+    print(f"first reply          {result['first_reply'] * 1000:8.0f} ms   (loads index / models lazily)")
+    print(f"second reply         {result['second_reply'] * 1000:8.0f} ms   (warm)")
+    print(f"process wall time    {wall * 1000:8.0f} ms   (interpreter start to first reply)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["imports", "cold-start"])
+    parser.add_argument("--backend", default="fake", help="LLM backend for cold-start (default: fake)")
+    args = parser.parse_args()
+
+    if args.command == "imports":
+        profile_imports(HEAVY_MODULES + APP_MODULES)
+    else:
+        cold_start(args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+from error_codes import ErrorCodeExtractor
+
+KNOWN = {10501, 10502, 250}
+
+
+def codes(text):
+    return set(ErrorCodeExtractor(KNOWN).extract(text))
+
+
+def test_comma_separated_codes():
+    assert codes("Errors 10501,10502 on the spindle") == {10501, 10502}
+
+
+def test_comma_and_space_separated_codes():
+    assert codes("Errors 10501, 10502 on the spindle") == {10501, 10502}
+
+
+def test_thousands_groups_dates_and_decimals_are_not_codes():
+    assert codes("Order of 12,250 parts on 10/05/2024 at 10:30, v1.10501") == set()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from llm_backends import FakeBackend, register_backend
+from llm_router import LLMRouter
+
+PROMPT = "Customer reports alarm 10501 on the spindle drive. " * 20
+
+
+@register_backend("test_slow")
+class SlowBackend(FakeBackend):
+    """Streams after a delay and, like Gemini/Ollama, reports usage only with its last chunk."""
+
+    def __init__(self, **kwargs):
+        super().__init__(reply="slow first line\nslow second line\n", delay=0.3, **kwargs)
+
+
+@register_backend("test_quick")
+class QuickBackend(FakeBackend):
+    def __init__(self, **kwargs):
+        super().__init__(reply="quick reply\n", **kwargs)
+
+
+@register_backend("test_silent")
+class SilentBackend(FakeBackend):
+    """Returns a reply without token counts."""
+
+    def __init__(self, **kwargs):
+        super().__init__(reply="silent reply", delay=0.3, **kwargs)
+
+    def _generate(self, prompt):
+        text, _ = super()._generate(prompt)
+        return text, {}
+
+
+def collect_usage():
+    calls = []
+    done = threading.Event()
+
+    def on_usage(backend, usage, latency):
+        calls.append((backend, usage))
+        done.set()
+
+    return calls, done, on_usage
+
+
+def test_stream_hedge_loser_records_prompt_tokens():
+    router = LLMRouter(["test_slow", "test_quick"], hedge_delay=0.05, latency_budget=5)
+    calls, done, on_usage = collect_usage()
+
+    usage = {}
+    text = "".join(router.stream(PROMPT, usage=usage, on_usage=on_usage))
+
+    assert text == "quick reply\n"
+    assert usage["backend"] == "test_quick"
+    assert done.wait(2), "the losing stream was never accounted"
+    backend, loser = calls[0]
+    assert backend == "test_slow"
+    assert loser["input_tokens"] == len(PROMPT) // 4 > 0
+    assert loser["output_tokens"] == len("slow first line\n") // 4
+
+
+def test_generate_hedge_loser_without_counts_is_estimated():
+    router = LLMRouter(["test_silent", "test_quick"], hedge_delay=0.05, latency_budget=5)
+    calls, done, on_usage = collect_usage()
+
+    response = router.generate(PROMPT, on_usage=on_usage)
+
+    assert response.backend == "test_quick"
+    assert done.wait(2)
+    backend, loser = calls[0]
+    assert backend == "test_silent"
+    assert loser["input_tokens"] == len(PROMPT) // 4 > 0
+
+
+def test_half_open_breaker_admits_one_trial_call():
+    router = LLMRouter(["test_quick"], failure_threshold=1, reset_timeout=0.05)
+    breaker = router.breakers["test_quick"]
+    breaker.record_failure(RuntimeError("down"))
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
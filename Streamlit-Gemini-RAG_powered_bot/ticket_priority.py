@@ -0,0 +1,159 @@
+"""
+Priority scheduling of tickets in front of the generation stage.
+
+Priority level 0 (P0) is served first. A ticket's level is
+
+    severity of its issue(s)  +  sender domain tier adjustment   (clamped to P0..P3)
+
+Severity comes from an optional "severity" field on knowledge-base records
+(critical / high / normal / low); records without it fall back to keywords
+in the issue text, then in the mail body. Waiting tickets age: every
+PRIORITY_AGING_SECONDS of age counts as one level, so routine mail cannot
+starve behind a stream of outages.
+
+    PRIORITY_DOMAIN_TIERS=bigcustomer.com=-1,partner.com=-1,gmail.com=1
+    PRIORITY_AGING_SECONDS=600
+"""
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from collections import deque
+
+SEVERITY_LEVELS = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+DEFAULT_SEVERITY = "normal"
+LEVELS = range(len(SEVERITY_LEVELS))
+
+# First matching group wins; checked against the issue text (or the mail body)
+SEVERITY_KEYWORDS = [
+    ("critical", (
+        "signal lost", "link down", "bus off", "not detected", "failed", "failure", "critical",
+        "stopped unexpectedly", "unresponsive", "short circuit", "open circuit", "broken wire",
+        "outage", "production down", "machine down", "not working",
+    )),
+    ("high", (
+        "clipping", "stuck", "timeout", "disconnected", "voltage", "overflow", "corrupted",
+        "conflict", "mismatch", "denied", "expired", "urgent",
+    )),
+    ("low", (
+        "led status", "indicator", "false positive", "how to", "question",
+    )),
+]
+
+WAIT_SAMPLES = 200
+
+
+def issue_severity(record: dict) -> str:
+    """Explicit "severity" metadata, else keyword fallback on the issue text."""
+    severity = str(record.get("severity", "")).lower()
+    if severity in SEVERITY_LEVELS:
+        return severity
+    return text_severity(record.get("issue", "")) or DEFAULT_SEVERITY
+
+
+def text_severity(text: str):
+    text = text.lower()
+    for severity, keywords in SEVERITY_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return severity
+    return None
+
+
+def domain_tiers() -> dict:
+    """'acme.com=-1,gmail.com=1' -> {'acme.com': -1, 'gmail.com': 1}"""
+    tiers = {}
+    for item in os.getenv("PRIORITY_DOMAIN_TIERS", "").split(","):
+        domain, _, adjust = item.partition("=")
+        try:
+            tiers[domain.strip().lower()] = int(adjust)
+        except ValueError:
+            continue
+    return tiers
+
+
+def sender_domain(sender: str) -> str:
+    match = re.search(r"@([\w.-]+)", sender or "")
+    return match.group(1).lower() if match else ""
+
+
+def ticket_priority(records: list, sender: str, body: str = "") -> int:
+    if records:
+        level = min(SEVERITY_LEVELS[issue_severity(r)] for r in records)
+    else:
+        level = SEVERITY_LEVELS[text_severity(body) or DEFAULT_SEVERITY]
+
+    domain = sender_domain(sender)
+    tiers = domain_tiers()
+    # Most specific match: "eu.acme.com" falls back to "acme.com"
+    parts = domain.split(".")
+    for i in range(len(parts) - 1):
+        suffix = ".".join(parts[i:])
+        if suffix in tiers:
+            level += tiers[suffix]
+            break
+    return max(min(LEVELS), min(max(LEVELS), level))
+
+
+class TicketQueue:
+    """
+    Thread-safe priority queue of tickets with aging.
+
+    The effective key is level - age / aging. Age is now - received, and
+    `now` is the same for every queued ticket, so ordering by
+    level + received / aging is equivalent and never changes - a plain heap
+    works.
+    """
+
+    def __init__(self, aging_seconds: float = None):
+        self.aging = aging_seconds or float(os.getenv("PRIORITY_AGING_SECONDS", "600"))
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._waits = {level: deque(maxlen=WAIT_SAMPLES) for level in LEVELS}
+
+    def push(self, ticket: dict, level: int):
+        received = ticket.get("received") or time.time()
+        ticket["priority"] = level
+        ticket["enqueued"] = time.time()
+        with self._lock:
+            heapq.heappush(self._heap, (level + received / self.aging, next(self._seq), ticket))
+
+    def pop(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            _, _, ticket = heapq.heappop(self._heap)
+            self._waits[ticket["priority"]].append(time.time() - ticket["enqueued"])
+        return ticket
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def status(self) -> dict:
+        """Per-priority depth, oldest waiting ticket and recent wait times."""
+        now = time.time()
+        with self._lock:
+            queued = [t for _, _, t in self._heap]
+            waits = {level: list(samples) for level, samples in self._waits.items()}
+        status = {}
+        for level in LEVELS:
+            waiting = [now - t["enqueued"] for t in queued if t["priority"] == level]
+            samples = waits[level]
+            status[f"P{level}"] = {
+                "depth": len(waiting),
+                "oldest_wait": max(waiting, default=0.0),
+                "avg_wait": sum(samples) / len(samples) if samples else 0.0,
+                "max_wait": max(samples, default=0.0),
+                "recent": len(samples),
+            }
+        return status
+
+
+ticket_queue = TicketQueue()
+
+
+def queue_status() -> dict:
+    return ticket_queue.status()
@@ -0,0 +1,128 @@
+"""
+Token and cost accounting for LLM calls.
+
+Every billed LLM call records the backend's reported input/output tokens and
+latency in a small SQLite file, keyed by ticket (Gmail message id), mailbox
+and day - including hedged requests that lost the race (llm_router.py).
+The dashboard reads the aggregates.
+
+    USAGE_DB=usage.sqlite3
+    LLM_PRICE_GEMINI_INPUT=0.30     USD per 1M input tokens
+    LLM_PRICE_GEMINI_OUTPUT=2.50    USD per 1M output tokens
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_PRICES = {
+    # backend: (input, output) USD per 1M tokens
+    "gemini": (0.30, 2.50),
+}
+
+_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    ticket_id TEXT,
+    mailbox TEXT,
+    backend TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_day ON llm_usage (day, backend);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_ticket ON llm_usage (ticket_id);
+"""
+
+
+def usage_db_path() -> str:
+    return os.getenv("USAGE_DB", "usage.sqlite3")
+
+
+@contextmanager
+def _connect(path: str = None):
+    conn = sqlite3.connect(path or usage_db_path(), timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def price(backend: str) -> tuple:
+    default_in, default_out = DEFAULT_PRICES.get(backend, (0.0, 0.0))
+    prefix = f"LLM_PRICE_{backend.upper()}_"
+    return (
+        float(os.getenv(prefix + "INPUT", default_in)),
+        float(os.getenv(prefix + "OUTPUT", default_out)),
+    )
+
+
+def cost(backend: str, input_tokens: int, output_tokens: int) -> float:
+    price_in, price_out = price(backend)
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+def record_usage(backend: str, usage: dict, latency: float = None,
+                 ticket_id: str = None, mailbox: str = None, path: str = None):
+    """Store one LLM call. Never raises - accounting must not break sending."""
+    now = time.time()
+    try:
+        with _lock, _connect(path) as conn:
+            conn.execute(
+                "INSERT INTO llm_usage (ts, day, ticket_id, mailbox, backend, input_tokens, output_tokens, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    now,
+                    time.strftime("%Y-%m-%d", time.localtime(now)),
+                    ticket_id,
+                    mailbox,
+                    backend or "unknown",
+                    int((usage or {}).get("input_tokens", 0) or 0),
+                    int((usage or {}).get("output_tokens", 0) or 0),
+                    latency,
+                ),
+            )
+    except sqlite3.Error as e:
+        print(f"[USAGE ERROR] {e}")
+
+
+def _aggregate(group_by: str, where: str = "", params: tuple = (), limit: int = 30, path: str = None) -> list:
+    """Grouped totals, most recent group first; limit=None returns every group."""
+    query = (
+        f"SELECT {group_by}, COUNT(*) AS calls, SUM(input_tokens) AS input_tokens, "
+        f"SUM(output_tokens) AS output_tokens, AVG(latency) AS avg_latency "
+        f"FROM llm_usage {where} GROUP BY {group_by} ORDER BY MAX(ts) DESC"
+    )
+    if limit is not None:
+        query += " LIMIT ?"
+        params = params + (limit,)
+    try:
+        with _connect(path) as conn:
+            rows = [dict(r) for r in conn.execute(query, params)]
+    except sqlite3.Error:
+        return []
+    for row in rows:
+        row["cost_usd"] = round(cost(row.get("backend", ""), row["input_tokens"] or 0, row["output_tokens"] or 0), 6)
+    return rows
+
+
+def usage_by_day(days: int = 14, path: str = None) -> list:
+    """One row per (day, backend) of the last `days` days with calls, tokens, average latency and cost."""
+    since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400))
+    return _aggregate("day, backend", where="WHERE day >= ?", params=(since,), limit=None, path=path)
+
+
+def usage_by_ticket(limit: int = 50, path: str = None) -> list:
+    return _aggregate("ticket_id, backend", where="WHERE ticket_id IS NOT NULL", limit=limit, path=path)
+
+
+def usage_by_mailbox(path: str = None) -> list:
+    return _aggregate("mailbox, backend", where="WHERE mailbox IS NOT NULL", limit=None, path=path)
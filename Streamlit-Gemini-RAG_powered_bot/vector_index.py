@@ -0,0 +1,227 @@
+"""
+Lightweight vector index for the issue knowledge base.
+
+Normalized float32 embeddings live in a memory-mapped .npy file, so a query
+is one matrix-vector product over the whole corpus. For large corpora an
+optional HNSW graph (hnswlib) is used instead of the brute-force scan.
+
+Each write goes to a new generation directory (gen-<ns>/) and is published by
+replacing the CURRENT pointer file, so a reader always gets embeddings, rows
+and graph from the same build.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from knowledge_base import record_text
+
+EMBEDDINGS_FILE = "embeddings.npy"
+ROWS_FILE = "rows.json"
+HNSW_FILE = "hnsw.bin"
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+DEFAULT_INDEX_DIR = "vector_index"
+HNSW_MIN_ROWS = 20000  # below this a brute-force scan is faster than HNSW
+HNSW_EF_SEARCH = 100
+
+
+def vector_index_dir() -> str:
+    return os.getenv("VECTOR_INDEX_DIR", DEFAULT_INDEX_DIR)
+
+
+def normalize(vectors) -> np.ndarray:
+    """Return float32 row vectors scaled to unit length (cosine == dot product)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _files_dir(directory: str) -> str:
+    """Generation directory CURRENT points to (the index directory itself for older builds)."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return directory
+
+
+def _hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        return None
+    return hnswlib
+
+
+def embed_texts(embedding_model, texts: list, batch_size: int = 64) -> np.ndarray:
+    """Embed texts in batches and return a normalized float32 matrix."""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedding_model.embed_documents(texts[start:start + batch_size]))
+    return normalize(vectors)
+
+
+class VectorIndex:
+    def __init__(self, directory: str, embeddings: np.ndarray, rows: list, hnsw=None):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.rows = rows
+        self.hnsw = hnsw
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def dimension(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    # ============================================
+    # BUILD / PERSIST
+    # ============================================
+    @staticmethod
+    def write(directory: str, matrix: np.ndarray, rows: list, use_hnsw: bool = None):
+        """Persist embeddings + rows as a new generation and switch CURRENT to it atomically."""
+        os.makedirs(directory, exist_ok=True)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        previous = os.path.basename(_files_dir(directory))
+        generation = f"{GENERATION_PREFIX}{time.time_ns()}"
+        files_dir = os.path.join(directory, generation)
+        os.makedirs(files_dir)
+
+        with open(os.path.join(files_dir, EMBEDDINGS_FILE), "wb") as f:
+            np.save(f, matrix)
+        with open(os.path.join(files_dir, ROWS_FILE), "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+
+        if use_hnsw is None:
+            use_hnsw = len(rows) >= HNSW_MIN_ROWS
+        hnswlib = _hnswlib() if use_hnsw else None
+        if hnswlib is not None and len(rows):
+            graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+            graph.init_index(max_elements=len(rows), ef_construction=200, M=16)
+            graph.add_items(matrix, np.arange(len(rows)))
+            graph.save_index(os.path.join(files_dir, HNSW_FILE))
+
+        pointer = os.path.join(directory, CURRENT_FILE)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(pointer + ".tmp", pointer)
+
+        # Keep the generation a reader may still be opening; drop older ones and pre-generation files
+        for name in os.listdir(directory):
+            if name.startswith(GENERATION_PREFIX) and name not in (generation, previous):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        for name in (EMBEDDINGS_FILE, ROWS_FILE, HNSW_FILE):
+            if os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+
+    @classmethod
+    def build(cls, records: list, embedding_model, directory: str = None,
+              use_hnsw: bool = None, batch_size: int = 64):
+        """Embed every knowledge-base record and write a fresh index."""
+        directory = directory or vector_index_dir()
+        rows = [dict(record, text=record_text(record)) for record in records]
+        matrix = embed_texts(embedding_model, [r["text"] for r in rows], batch_size)
+        cls.write(directory, matrix, rows, use_hnsw)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str = None):
+        """Open an index from disk; embeddings are memory-mapped, not copied."""
+        directory = directory or vector_index_dir()
+        files_dir = _files_dir(directory)
+        embeddings = np.load(os.path.join(files_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(files_dir, ROWS_FILE), "r", encoding="utf-8") as f:
+            rows = json.load(f)
+
+        hnsw = None
+        hnsw_path = os.path.join(files_dir, HNSW_FILE)
+        hnswlib = _hnswlib()
+        if hnswlib is not None and os.path.exists(hnsw_path):
+            hnsw = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+            hnsw.load_index(hnsw_path, max_elements=len(rows))
+            hnsw.set_ef(HNSW_EF_SEARCH)
+
+        return cls(directory, embeddings, rows, hnsw)
+
+    @staticmethod
+    def exists(directory: str = None) -> bool:
+        files_dir = _files_dir(directory or vector_index_dir())
+        return os.path.exists(os.path.join(files_dir, EMBEDDINGS_FILE)) and \
+            os.path.exists(os.path.join(files_dir, ROWS_FILE))
+
+    # ============================================
+    # QUERY
+    # ============================================
+    def search_ids_by_vector(self, vector, k: int = 2) -> list:
+        """Return [(row_id, cosine_score), ...] best first."""
+        if not self.rows:
+            return []
+        k = min(k, len(self.rows))
+        query = normalize(vector)[0]
+
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            return [(int(i), float(1.0 - d)) for i, d in zip(labels[0], distances[0])]
+
+        scores = self.embeddings @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search_ids_by_vectors(self, vectors, k: int = 2) -> list:
+        """Batched search: one [(row_id, score), ...] list per query vector."""
+        queries = normalize(vectors)
+        if not self.rows or not len(queries):
+            return [[] for _ in range(len(queries))]
+        k = min(k, len(self.rows))
+
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(queries, k=k)
+            return [
+                [(int(i), float(1.0 - d)) for i, d in zip(row_labels, row_distances)]
+                for row_labels, row_distances in zip(labels, distances)
+            ]
+
+        scores = queries @ self.embeddings.T  # (queries, rows) in one product
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for q, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[q, candidates])]
+            results.append([(int(i), float(scores[q, i])) for i in ordered])
+        return results
+
+    def score_ids(self, vector, row_ids: list) -> list:
+        """Cosine score of the query against specific rows only."""
+        if not row_ids:
+            return []
+        query = normalize(vector)[0]
+        return [float(s) for s in self.embeddings[np.asarray(row_ids)] @ query]
+
+    def search_by_vector(self, vector, k: int = 2) -> list:
+        """Return [(row, cosine_score), ...] best first."""
+        return [(self.rows[i], score) for i, score in self.search_ids_by_vector(vector, k)]
+
+    def search(self, query: str, embedding_model, k: int = 2) -> list:
+        return self.search_by_vector(embedding_model.embed_query(query), k)
+
+
+# ============================================
+# PROCESS-WIDE INSTANCE
+# ============================================
+def get_vector_index() -> VectorIndex:
+    """
+    Index of the current knowledge-base snapshot (kb_manager.py). It is built
+    on first use if missing, stale, or made with a different embedding model
+    than EMBEDDING_MODEL, so query and index vectors come from the same model.
+    """
+    from kb_manager import current_snapshot
+
+    return current_snapshot().vector_index()
@@ -0,0 +1,185 @@
+"""
+Background warm-up of the reply pipeline.
+
+The knowledge base, retrieval index, embedding model and LLM client are
+loaded in parallel and each gets one dummy inference, so the first ticket
+does not pay for downloads or client initialisation. The LLM only gets a
+probe (model metadata for Gemini, model load for Ollama) - no billed
+generation. Fallback backends are probed too, but they are optional: a
+fallback that is down never holds back readiness. The worker only answers
+tickets with a known error code, so the embedding model and retrieval index
+are optional as well when those tickets never embed: RETRIEVAL_MODE=on_miss,
+or a precomputed neighbors.json for the loaded knowledge-base version.
+Per-component state is kept in `readiness` for the dashboard.
+
+    WARMUP_LLM_PROBE=1       probe the LLM backends (0: only create the clients)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+_lock = threading.Lock()
+readiness = {}  # component -> {"state", "seconds", "error"}
+
+
+def _set(component: str, **fields):
+    with _lock:
+        readiness.setdefault(component, {"state": PENDING, "seconds": None, "error": None}).update(fields)
+
+
+def readiness_status() -> dict:
+    with _lock:
+        return {name: dict(info) for name, info in readiness.items()}
+
+
+# ============================================
+# COMPONENTS
+# ============================================
+def _warm_knowledge_base():
+    from knowledge_base import get_knowledge_base
+
+    get_knowledge_base()
+
+
+def _warm_embedding_model():
+    from embeddings import get_embedding_model
+
+    get_embedding_model().embed_query("warm up")
+
+
+def _warm_retrieval():
+    from retrieval import retrieve
+
+    retrieve("signal lost on channel 1", k=1)
+
+
+def _llm_probe() -> bool:
+    return os.getenv("WARMUP_LLM_PROBE", "1").lower() in ("1", "true", "yes")
+
+
+def _warm_llm():
+    from llm_backends import backend_name, get_backend
+
+    backend = get_backend(backend_name())
+    if _llm_probe():
+        backend.warm_up()
+
+
+def _warm_llm_fallbacks():
+    from llm_backends import get_backend
+    from llm_router import router_backends
+
+    errors = []
+    for name in router_backends()[1:]:
+        try:
+            backend = get_backend(name)
+            if _llm_probe():
+                backend.warm_up()
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+
+COMPONENTS = {
+    "knowledge_base": _warm_knowledge_base,
+    "embedding_model": _warm_embedding_model,
+    "retrieval_index": _warm_retrieval,
+    "llm_client": _warm_llm,
+    "llm_fallbacks": _warm_llm_fallbacks,
+}
+
+# Warmed in the background but never waited for
+OPTIONAL = {"llm_fallbacks"}
+# Also optional when known-code tickets are answered without an embedding
+RETRIEVAL = {"embedding_model", "retrieval_index"}
+
+
+def known_codes_embed() -> bool:
+    """Would a ticket with a known error code run the embedding model?"""
+    import related_issues
+    from kb_manager import current_snapshot
+    from retrieval_policy import get_retrieval_policy
+
+    if get_retrieval_policy().mode == "on_miss":
+        return False
+    if not related_issues.enabled():
+        return True
+    snapshot = current_snapshot()
+    table = related_issues.load_neighbors(snapshot.index_dir)
+    return table is None or snapshot.version not in table.get("kb_versions", [])
+
+
+def optional_components() -> set:
+    try:
+        embeds = known_codes_embed()
+    except Exception:
+        embeds = True  # unknown: keep waiting for retrieval, as before
+    return set(OPTIONAL) if embeds else OPTIONAL | RETRIEVAL
+
+
+class WarmUp:
+    def __init__(self, log=print, components: dict = None, optional: set = None):
+        self.log = log
+        self.components = components or COMPONENTS
+        self._optional = optional
+        self.optional = set(OPTIONAL) if optional is None else optional
+        self._pool = ThreadPoolExecutor(max_workers=len(self.components), thread_name_prefix="warmup")
+        self._futures = {}
+
+    def _run(self, name: str, fn):
+        _set(name, state=LOADING, error=None)
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            _set(name, state=FAILED, seconds=time.perf_counter() - start, error=str(e))
+            if name in self.optional:
+                self.log(f"⚠️ Warm-up {name} failed (optional, not waited for): {e}")
+            else:
+                self.log(f"❌ Warm-up {name} failed: {e}")
+            return False
+        seconds = time.perf_counter() - start
+        _set(name, state=READY, seconds=seconds)
+        self.log(f"🔥 {name} ready ({seconds:.1f}s)")
+        return True
+
+    def start(self):
+        """Kick off every component in parallel and return once it is known which are optional."""
+        for name in self.components:
+            _set(name, state=PENDING, seconds=None, error=None, optional=name in self.optional)
+        for name, fn in self.components.items():
+            self._futures[self._pool.submit(self._run, name, fn)] = name
+        self._pool.shutdown(wait=False)
+        if self._optional is None:
+            # Loads the knowledge base, which the knowledge_base component shares
+            self.optional = optional_components()
+            for name in self.components:
+                _set(name, optional=name in self.optional)
+        return self
+
+    def wait(self, timeout: float = None, cancel=None) -> bool:
+        """
+        Block until all required components finished; True only if every one
+        is ready. Returns early (False) when the optional `cancel` event is set.
+        """
+        required = [f for f, name in self._futures.items() if name not in self.optional]
+        if cancel is None:
+            done, not_done = wait(required, timeout=timeout)
+        else:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                step = 0.5 if remaining is None else min(0.5, remaining)
+                done, not_done = wait(required, timeout=step)
+                if not not_done or cancel.is_set() or remaining == 0.0:
+                    break
+        for future in not_done:
+            self.log(f"⏳ Warm-up {self._futures[future]} still running after {timeout}s")
+        return not not_done and all(f.result() for f in done)
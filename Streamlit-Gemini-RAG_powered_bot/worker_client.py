@@ -0,0 +1,72 @@
+"""
+HTTP client of worker_daemon.py, used by the Streamlit dashboard.
+
+    WORKER_API_URL=http://127.0.0.1:8765
+    WORKER_API_TOKEN=          same secret as the daemon, if it has one
+"""
+import os
+
+import requests
+
+
+class WorkerUnavailable(Exception):
+    """The worker daemon did not answer (not started, crashed or wrong URL)."""
+
+
+class WorkerClient:
+    def __init__(self, url: str = None, token: str = None, timeout: float = 5.0):
+        self.url = (url or os.getenv("WORKER_API_URL", "http://127.0.0.1:8765")).rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        token = token or os.getenv("WORKER_API_TOKEN")
+        if token:
+            self.session.headers["X-Worker-Token"] = token
+
+    def _request(self, method: str, path: str, **kwargs) -> dict:
+        try:
+            r = self.session.request(method, f"{self.url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise WorkerUnavailable(f"Worker daemon not reachable at {self.url}: {e}") from e
+        if r.status_code >= 500 or r.status_code == 401:
+            raise WorkerUnavailable(f"Worker daemon error {r.status_code}: {r.text[:200]}")
+        # 4xx payloads carry an "error" message for the UI
+        return r.json()
+
+    def health(self) -> bool:
+        try:
+            return self._request("GET", "/health").get("ok", False)
+        except WorkerUnavailable:
+            return False
+
+    def status(self) -> dict:
+        return self._request("GET", "/status")
+
+    def metrics(self) -> dict:
+        return self._request("GET", "/metrics")
+
+    def logs(self, after: int = 0) -> dict:
+        return self._request("GET", "/logs", params={"after": after})
+
+    def start(self, poll_interval: int, gmail: str = None, gemini_key: str = None) -> dict:
+        return self._request("POST", "/start", json={
+            "poll_interval": poll_interval, "gmail": gmail, "gemini_key": gemini_key,
+        })
+
+    def stop(self, drain_timeout: float = None) -> dict:
+        return self._request("POST", "/stop", json={"drain_timeout": drain_timeout})
+
+    def upload(self, name: str, data: bytes) -> dict:
+        return self._request("POST", f"/files/{name}", data=data)
+
+    def replay(self, msg_id: str) -> dict:
+        return self._request("POST", "/replay", json={"msg_id": msg_id})
+
+
+_client = None
+
+
+def get_worker_client() -> WorkerClient:
+    global _client
+    if _client is None:
+        _client = WorkerClient()
+    return _client
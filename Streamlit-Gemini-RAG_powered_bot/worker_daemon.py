@@ -0,0 +1,311 @@
+"""
+Standalone email worker process with a small local control / metrics API.
+
+The worker thread used to live inside the Streamlit server, so a UI reload,
+a Streamlit restart or a memory spike in the UI took automation down with
+it. This process runs email_worker.worker_loop on its own (systemd unit or
+second container, see README) and app.py talks to it over HTTP through
+worker_client.py.
+
+    python worker_daemon.py                                  API only, start from the UI
+    python worker_daemon.py --start --gmail me@example.com   start polling right away
+
+    WORKER_API_HOST=127.0.0.1
+    WORKER_API_PORT=8765
+    WORKER_API_TOKEN=          shared secret, sent as X-Worker-Token; required when
+                               WORKER_API_HOST is not a loopback address
+    WORKER_LOG_BUFFER=2000     log lines kept for the dashboard
+
+Endpoints (JSON):
+    GET  /health               liveness (systemd / compose health checks)
+    GET  /status               worker state, missing files, Gemini key present
+    GET  /metrics              readiness, LLM backends, rate limits, queues, usage
+    GET  /logs?after=<seq>     log lines newer than seq
+    POST /start                {"poll_interval": 10, "gmail": "...", "gemini_key": "..."}
+    POST /stop                 {"drain_timeout": 30}   (default DRAIN_TIMEOUT)
+    POST /files/<name>         raw body of one of REQUIRED_FILES, or of the knowledge
+                               base file (hot-reloaded, see kb_manager.py)
+    POST /replay               {"msg_id": "..."}   dead letter back into the retry queue
+
+SIGTERM / SIGINT stop the worker with the normal drain before exiting.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from email_worker import start_worker, stop_worker, subscribe_logs, worker_status  # noqa: E402
+from knowledge_base import knowledge_base_path, parse_knowledge_base  # noqa: E402
+
+REQUIRED_FILES = ("credentials.json", "token_read.json", "token_send.json", "possible_error.json")
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+
+
+# ============================================
+# LOG BUFFER
+# ============================================
+class LogBuffer:
+    """Last N log lines with increasing sequence numbers, polled by the dashboard."""
+
+    def __init__(self, size: int = 2000):
+        self._lines = deque(maxlen=size)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def add(self, msg: str):
+        with self._lock:
+            self._seq += 1
+            self._lines.append((self._seq, time.time(), str(msg).strip()))
+
+    def since(self, after: int = 0) -> dict:
+        with self._lock:
+            lines = [line for seq, _, line in self._lines if seq > after]
+            return {"next": self._seq, "lines": lines}
+
+
+log_buffer = LogBuffer(int(os.getenv("WORKER_LOG_BUFFER", "2000")))
+
+
+# ============================================
+# ACTIONS
+# ============================================
+def update_env_file(gemini_key: str):
+    """Persist the Gemini key in .env and make it visible to this process."""
+    env_data = {}
+
+    if os.path.exists(".env"):
+        with open(".env", "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                k, v = line.split("=", 1)
+                env_data[k.strip()] = v.strip()
+
+    env_data["GEMINI_API_KEY"] = gemini_key
+    with open(".env.tmp", "w") as f:
+        for k, v in env_data.items():
+            f.write(f"{k}={v}\n")
+    os.replace(".env.tmp", ".env")
+    os.environ["GEMINI_API_KEY"] = gemini_key
+
+
+def status() -> dict:
+    return {
+        **worker_status(),
+        "missing_files": [name for name in REQUIRED_FILES if not os.path.exists(name)],
+        "gemini_key_set": bool(os.getenv("GEMINI_API_KEY")),
+        "gmail": os.getenv("AUTOMATION_GMAIL"),
+        "knowledge_base_file": os.path.basename(knowledge_base_path()),
+        "pid": os.getpid(),
+    }
+
+
+def metrics() -> dict:
+    # Imported lazily: these are the same singletons the worker thread updates
+    from kb_manager import kb_status
+    from llm_router import router_status
+    from rate_limiter import get_limiter
+    from retry_queue import dead_letters, pending
+    from ticket_priority import queue_status
+    from usage_store import usage_by_day, usage_by_mailbox, usage_by_ticket
+    from warmup import readiness_status
+
+    return {
+        "readiness": readiness_status(),
+        "knowledge_base": kb_status(),
+        "backends": router_status(),
+        "rate_limits": get_limiter().status(),
+        "ticket_queue": queue_status(),
+        "retry_queue": pending(),
+        "dead_letters": dead_letters(),
+        "usage_by_day": usage_by_day(),
+        "usage_by_ticket": usage_by_ticket(),
+        "usage_by_mailbox": usage_by_mailbox(),
+    }
+
+
+def start(payload: dict) -> tuple:
+    if payload.get("gemini_key"):
+        update_env_file(payload["gemini_key"])
+        log_buffer.add("GEMINI_API_KEY updated in .env")
+    if payload.get("gmail"):
+        os.environ["AUTOMATION_GMAIL"] = payload["gmail"]
+
+    current = status()
+    if not current["gemini_key_set"]:
+        return 400, {"started": False, "error": "Enter Gemini API Key."}
+    if current["missing_files"]:
+        return 400, {"started": False, "error": f"Upload {current['missing_files'][0]}."}
+
+    started = start_worker(poll_interval=int(payload.get("poll_interval", 10)))
+    return 200, {"started": started, "status": status()}
+
+
+def save_file(name: str, data: bytes) -> tuple:
+    is_knowledge_base = name == os.path.basename(knowledge_base_path())
+    if name not in REQUIRED_FILES and not is_knowledge_base:
+        return 404, {"saved": False, "error": f"Unknown file {name}"}
+    try:
+        # The knowledge base may also be a .kbc file (kb_columnar.py)
+        parse_knowledge_base(data, source=name) if is_knowledge_base else json.loads(data)
+    except Exception:
+        return 400, {"saved": False, "error": f"{name} is not a valid {'knowledge base' if is_knowledge_base else 'JSON file'}"}
+
+    # Temp file + rename: readers never see a half-written file
+    path = knowledge_base_path() if is_knowledge_base else name
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    log_buffer.add(f"Saved {name}")
+
+    if is_knowledge_base:
+        from kb_manager import get_kb_manager
+
+        get_kb_manager().reload()
+        log_buffer.add("📚 Rebuilding knowledge base index in the background...")
+    return 200, {"saved": True, "reloading": is_knowledge_base}
+
+
+# ============================================
+# HTTP API
+# ============================================
+class Handler(BaseHTTPRequestHandler):
+    server_version = "EmailWorker/1.0"
+
+    def _send(self, code: int, payload: dict):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        token = os.getenv("WORKER_API_TOKEN")
+        if token and not hmac.compare_digest(self.headers.get("X-Worker-Token", ""), token):
+            self._send(401, {"error": "unauthorized"})
+            return False
+        return True
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            raise ValueError("request body too large")
+        return self.rfile.read(length) if length else b""
+
+    def _json(self) -> dict:
+        body = self._body()
+        return json.loads(body) if body else {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send(200, {"ok": True})
+        if not self._authorized():
+            return
+        try:
+            if url.path == "/status":
+                return self._send(200, status())
+            if url.path == "/metrics":
+                return self._send(200, metrics())
+            if url.path == "/logs":
+                after = int(parse_qs(url.query).get("after", ["0"])[0])
+                return self._send(200, log_buffer.since(after))
+            self._send(404, {"error": f"unknown endpoint {url.path}"})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if not self._authorized():
+            return
+        try:
+            if url.path == "/start":
+                return self._send(*start(self._json()))
+            if url.path == "/stop":
+                stopped = stop_worker(drain_timeout=self._json().get("drain_timeout"))
+                return self._send(200, {"stopped": stopped, "status": status()})
+            if url.path.startswith("/files/"):
+                return self._send(*save_file(url.path[len("/files/"):], self._body()))
+            if url.path == "/replay":
+                from retry_queue import replay
+
+                return self._send(200, {"replayed": replay(self._json()["msg_id"])})
+            self._send(404, {"error": f"unknown endpoint {url.path}"})
+        except (ValueError, KeyError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def log_request(self, code="-", size="-"):
+        # Access logs only for failures - the dashboard polls every 2s
+        if str(getattr(code, "value", code)).startswith(("4", "5")):
+            super().log_request(code, size)
+
+
+# ============================================
+# MAIN
+# ============================================
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("WORKER_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("WORKER_API_PORT", "8765")))
+    parser.add_argument("--start", action="store_true", help="start polling Gmail at launch")
+    parser.add_argument("--gmail", default=os.getenv("AUTOMATION_GMAIL"), help="mailbox for --start")
+    parser.add_argument("--poll-interval", type=int, default=10)
+    args = parser.parse_args()
+
+    if not is_loopback(args.host) and not os.getenv("WORKER_API_TOKEN"):
+        # start / stop / file uploads must not be open to the whole network
+        raise SystemExit(f"❌ Refusing to serve the worker API on {args.host} without WORKER_API_TOKEN")
+
+    subscribe_logs(log_buffer.add, session="daemon")
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"🛰️ Worker API listening on http://{args.host}:{args.port}")
+
+    def shutdown(signum, frame):
+        # serve_forever() runs in this thread, so shut it down from another one
+        def drain_and_exit():
+            print("🛑 Shutdown signal - draining worker...")
+            stop_worker(wait=True)
+            server.shutdown()
+
+        threading.Thread(target=drain_and_exit, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    if args.start:
+        code, result = start({"gmail": args.gmail, "poll_interval": args.poll_interval})
+        if code != 200:
+            print(f"❌ Cannot start worker: {result['error']}")
+
+    server.serve_forever()
+    server.server_close()
+    print("👋 Worker daemon stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,39 +2,27 @@
 import base64
 import os
 import re
-import threading
 import time
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
 from email_generator import send_email
-from gemini_llm_response import run_generator
+from error_codes import ErrorCodeExtractor
+from gemini_llm_response import load_dataset, run_generator
+from worker_controller import WorkerController
 
 # Scopes
 SCOPES_send = ["https://www.googleapis.com/auth/gmail.send"]
 SCOPES_read = ["https://www.googleapis.com/auth/gmail.readonly"]
 
-# Globals
-seen_ids = set()
-worker_running = False
-log_callback = None
+# One worker per process, shared by every Streamlit session
+controller = WorkerController()
 
 
 # ============================================
 # LOGGING (THREAD-SAFE)
 # ============================================
 def log(msg: str):
-    """Logs to terminal AND safely queues for Streamlit."""
-    print(msg)  # Always print to console
-    if log_callback:
-        try:
-            # Use callback (which pushes to queue) - this is thread-safe
-            log_callback(msg)
-        except Exception as e:
-            print(f"[LOG ERROR] {e}")
+    """Logs to terminal AND to every subscribed Streamlit session."""
+    controller.log(msg)
 
 
 # ============================================
@@ -137,10 +125,22 @@ def process_new_message(service, msg_id):
     return [sender, subject, body]
 
 
+def load_known_codes(path: str = "possible_error.json"):
+    """issue_number values from the dataset, used to validate extracted codes."""
+    try:
+        return set(load_dataset(path))  # cached, re-parsed only when the file changes
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def error_codes_getter(body: str) -> list:
+    """All known issue numbers mentioned in the body, best match first."""
+    return ErrorCodeExtractor(load_known_codes()).extract(body)
+
+
 def error_code_getter(body: str):
-    pattern = r'[A-Za-z]+\s*[:\- ]\s*(\d+)'
-    match = re.search(pattern, body)
-    return match.group(1) if match else None
+    codes = error_codes_getter(body)
+    return str(codes[0]) if codes else None
 
 
 # ============================================
@@ -148,6 +148,9 @@ def error_code_getter(body: str):
 # ============================================
 def authenticate():
     """Authenticate Gmail API with proper error handling."""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
     creds_read = None
     creds_send = None
     
@@ -199,8 +202,8 @@ def authenticate():
 # ============================================
 # WORKER LOOP (BACKGROUND THREAD)
 # ============================================
-def worker_loop(poll_interval: int):
-    global worker_running
+def worker_loop(controller: WorkerController, poll_interval: int):
+    from googleapiclient.discovery import build
 
     log("🔐 Authenticating Gmail services...")
 
@@ -212,24 +215,21 @@ def worker_loop(poll_interval: int):
         log(f"❌ Authentication failed: {e}")
         log("")
         log("📋 Fix: Ensure all JSON files are uploaded and valid")
-        worker_running = False
+        controller.finished()
         return
 
     log(f"✅ Gmail monitoring active (poll interval: {poll_interval}s)")
     
     # Signal to UI that worker is ready
-    if log_callback:
-        try:
-            log_callback("WORKER_READY_SIGNAL")
-        except:
-            pass
+    controller.ready.set()
+    log("WORKER_READY_SIGNAL")
 
     log("⏸️  Press STOP in UI to halt automation")
     log("")
 
     email_count = 0
 
-    while worker_running:
+    while not controller.stopping:
         try:
             results = service_read.users().messages().list(
                 userId="me", q="is:unread", maxResults=5
@@ -244,10 +244,11 @@ def worker_loop(poll_interval: int):
             
             for item in msgs:
                 msg_id = item["id"]
-                if msg_id in seen_ids:
+                if controller.stopping:
+                    break
+                if not controller.claim(msg_id):
                     continue
 
-                seen_ids.add(msg_id)
                 log("")
                 log("🔥 NEW MESSAGE DETECTED")
 
@@ -288,37 +289,29 @@ def worker_loop(poll_interval: int):
         except Exception as e:
             log(f"⚠️ Worker error: {e}")
 
-        time.sleep(poll_interval)
+        controller.sleep(poll_interval)
 
+    controller.finished()
     log("🛑 Worker loop terminated.")
 
 
 # ============================================
 # CONTROL (CALLED FROM STREAMLIT)
 # ============================================
-def start_worker(poll_interval: int, logger=None):
-    """Start background worker thread."""
-    global worker_running, log_callback
+def start_worker(poll_interval: int, logger=None, session=None) -> bool:
+    """Start the background worker unless one is already running (any session)."""
+    return controller.start(worker_loop, poll_interval, logger=logger, key=session)
 
-    if worker_running:
-        if logger:
-            logger("⚠️ Worker already running.")
-        return
 
-    log_callback = logger
-    worker_running = True
+def stop_worker(wait: bool = False) -> bool:
+    """Stop polling at once; a reply already being written is finished first."""
+    return controller.stop(0, wait=wait)
 
-    t = threading.Thread(target=worker_loop, args=(poll_interval,), daemon=True)
-    t.start()
 
-    log("🚀 Background worker thread started")
+def subscribe_logs(logger, session=None):
+    """Attach a session's log sink to the (possibly already running) worker."""
+    controller.subscribe(logger, key=session)
 
 
-def stop_worker():
-    """Stop background worker thread."""
-    global worker_running
-    if worker_running:
-        worker_running = False
-        log("🛑 Stop signal sent - worker will halt after current cycle")
-    else:
-        log("ℹ️ Worker is not currently running")
+def worker_status() -> dict:
+    return controller.status()
@@ -0,0 +1,46 @@
+"""
+Error-code extraction from free-text support mails.
+
+A single compiled scan collects every number in the body; candidates are
+validated against the set of known issue numbers (so phone numbers, dates
+and order counts are ignored) and ranked by how close they sit to words
+like "error", "code" or "issue".
+"""
+import re
+
+# 3-7 digit numbers that are not part of a decimal, date, time, thousands group
+# (12,500) or longer digit run; a comma between codes ("10501,10502") separates them
+NUMBER_RE = re.compile(r"(?<![\d./:])(?!(?<=\d,)\d{3}\b)(\d{3,7})(?!\d|[./:]\d|,\d{3}\b)")
+KEYWORD_RE = re.compile(
+    r"\b(?:error|err|code|issue|fault|alarm|alert|problem|no|num|number)\b", re.IGNORECASE
+)
+FAR_AWAY = 10 ** 6
+
+
+class ErrorCodeExtractor:
+    def __init__(self, known_codes=None):
+        # None disables validation (every candidate counts), like the old single regex
+        self.known_codes = known_codes
+
+    def candidates(self, text: str) -> list:
+        """[(code, distance_to_keyword, position), ...] for every valid number."""
+        keywords = [m.end() for m in KEYWORD_RE.finditer(text)]
+        best = {}
+        for m in NUMBER_RE.finditer(text):
+            code = int(m.group(1))
+            if self.known_codes is not None and code not in self.known_codes:
+                continue
+            start = m.start()
+            distance = min((abs(start - k) for k in keywords), default=FAR_AWAY)
+            if code not in best or (distance, start) < best[code][1:]:
+                best[code] = (code, distance, start)
+        return list(best.values())
+
+    def extract(self, text: str) -> list:
+        """Every valid code in the text, best match first."""
+        ranked = sorted(self.candidates(text or ""), key=lambda c: (c[1], c[2]))
+        return [code for code, _, _ in ranked]
+
+    def first(self, text: str):
+        codes = self.extract(text)
+        return codes[0] if codes else None
@@ -1,12 +1,49 @@
+import json
+import os
+
+_dataset = {}
+_model = {}
+
+
+def load_dataset(path = 'possible_error.json'):
+    """
+    issue_number -> record, re-parsed only when the file changes.
+    The new dict replaces the old one in a single assignment, so a reply
+    never sees half of each version; a half-written or invalid file keeps
+    the previous version in service until it parses.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _dataset.get(path)
+    if cached is None or cached[0] != mtime:
+        try:
+            with open(path, 'r', encoding = 'utf-8') as f:
+                records = {int(r['issue_number']): r for r in json.load(f)}
+        except (ValueError, KeyError, TypeError) as e:
+            if cached is None:
+                raise
+            print(f'[DATASET] {path} not loaded ({e}), keeping the previous version')
+            return cached[1]
+        cached = (mtime, records)
+        _dataset[path] = cached
+    return cached[1]
+
+
+def get_model(api_key):
+    """Gemini client, configured once per API key instead of on every email."""
+    if _model.get('api_key') != api_key:
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        _model['model'] = genai.GenerativeModel("gemini-2.5-flash")
+        _model['api_key'] = api_key
+    return _model['model']
+
 
 class run_generator:
     @staticmethod
     def generate_email( issue_value):
 
-        import google.generativeai as genai
-        import pandas as pd
         from dotenv import load_dotenv
-        import os
 
         load_dotenv(override = True)
         gemini_api_key = os.getenv('GEMINI_API_KEY')
@@ -27,24 +64,15 @@ class run_generator:
         Uday Hiremath
         AI Expert
         '''
-        data = pd.read_json('possible_error.json')
-
-        issue_num = None
-        issue = None
-        solution = None
+        record = load_dataset().get(issue_value, {})
 
-
-        for i in zip(data['issue_number'], data['issue'], data['solution']):
-            if i[0] == issue_value:
-                issue_num = i[0]
-                issue = i[1]
-                solution = i[2]
+        issue_num = record.get('issue_number')
+        issue = record.get('issue')
+        solution = record.get('solution')
         
         prompt = f"Consider yourself as tech supporter, here is possible issue number{issue_num}, issue {issue} and solution {solution}.Consider the inputs and generate the final ouput as clean email , mention issue number, issue and solution(descriptive), generate in 100 words, here is templeate{template}"
         
-        genai.configure(api_key=api_key)
-        
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        model = get_model(api_key)
         
         response = model.generate_content(prompt)
         return response.text
@@ -0,0 +1,161 @@
+"""
+Lifecycle and shared state of the background email worker.
+
+One WorkerController lives per process (module import is cached, so every
+Streamlit session gets the same object). It replaces the old
+worker_running / log_callback / seen_ids module globals:
+
+  * start() is idempotent under a lock - concurrent sessions cannot start
+    two workers; a later session just subscribes to the running one's logs.
+  * stop() stops taking new mail at once; the poll sleep waits on the stop
+    event, so it ends immediately. The message in progress is finished.
+  * log() fans out to every subscribed session; claim() is an atomic
+    check-and-add on the seen message ids.
+"""
+import threading
+import time
+
+
+class WorkerController:
+    def __init__(self, name: str = "email-worker"):
+        self.name = name
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stop = threading.Event()    # no new work
+        self._abort = threading.Event()   # interrupt waits, drop the drain
+        self._abort_timer = None
+        self._subscribers = {}
+        self._seen = set()
+        self._seen_lock = threading.Lock()
+        self.started_at = None
+        self.poll_interval = None
+        self.ready = threading.Event()
+
+    # ============================================
+    # LOGGING
+    # ============================================
+    def subscribe(self, logger, key=None):
+        """Register a log sink (one per browser session); the same key replaces the old sink."""
+        if logger is None:
+            return
+        with self._lock:
+            self._subscribers[key if key is not None else id(logger)] = logger
+
+    def unsubscribe(self, key):
+        with self._lock:
+            self._subscribers.pop(key, None)
+
+    def log(self, msg: str):
+        """Logs to terminal AND to every subscribed session."""
+        print(msg)  # Always print to console
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for callback in subscribers:
+            try:
+                callback(msg)
+            except Exception as e:
+                print(f"[LOG ERROR] {e}")
+
+    # ============================================
+    # SHARED STATE
+    # ============================================
+    def claim(self, msg_id: str) -> bool:
+        """True the first time a message id is seen (atomic check-and-add)."""
+        with self._seen_lock:
+            if msg_id in self._seen:
+                return False
+            self._seen.add(msg_id)
+            return True
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    @property
+    def aborted(self) -> bool:
+        return self._abort.is_set()
+
+    @property
+    def cancel_event(self) -> threading.Event:
+        """Set when in-flight waits (rate limits, warm-up) should give up."""
+        return self._abort
+
+    def sleep(self, seconds: float) -> bool:
+        """Sleep until the next poll; returns True early when stop is requested."""
+        return self._stop.wait(seconds)
+
+    # ============================================
+    # CONTROL
+    # ============================================
+    def start(self, target, poll_interval: int, logger=None, key=None) -> bool:
+        """Start target(self, poll_interval) in a thread unless a worker is already alive."""
+        with self._lock:
+            self.subscribe(logger, key)
+            if self.running:
+                notify = logger or self.log
+                if self.stopping:
+                    notify("⏳ Worker is still stopping - try again in a moment.")
+                else:
+                    notify("⚠️ Worker already running.")
+                return False
+
+            self._stop.clear()
+            self._abort.clear()
+            self.ready.clear()
+            self.started_at = time.time()
+            self.poll_interval = poll_interval
+            self._thread = threading.Thread(target=target, args=(self, poll_interval), name=self.name, daemon=True)
+            self._thread.start()
+
+        self.log("🚀 Background worker thread started")
+        return True
+
+    def stop(self, drain_timeout: float = 0, wait: bool = False) -> bool:
+        """
+        Ask the worker to stop. Queued tickets get up to drain_timeout seconds
+        to finish (0 = abort now). With wait=True, block until the thread exits.
+        """
+        with self._lock:
+            if not self.running:
+                self.log("ℹ️ Worker is not currently running")
+                return False
+            self._stop.set()
+            if drain_timeout and drain_timeout > 0:
+                if self._abort_timer is not None:
+                    self._abort_timer.cancel()
+                self._abort_timer = threading.Timer(drain_timeout, self._abort.set)
+                self._abort_timer.daemon = True
+                self._abort_timer.start()
+                self.log(f"🛑 Stop signal sent - finishing current work for up to {drain_timeout:.0f}s")
+            else:
+                self._abort.set()
+                self.log("🛑 Stop signal sent - worker halts now")
+            thread = self._thread
+
+        if wait:
+            thread.join((drain_timeout or 0) + 30)
+        return True
+
+    def finished(self):
+        """Called by the worker thread on exit."""
+        with self._lock:
+            if self._abort_timer is not None:
+                self._abort_timer.cancel()
+                self._abort_timer = None
+            self.ready.clear()
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "stopping": self.running and self.stopping,
+            "ready": self.ready.is_set(),
+            "started_at": self.started_at,
+            "poll_interval": self.poll_interval,
+            "seen": len(self._seen),
+            "sessions": len(self._subscribers),
+        }
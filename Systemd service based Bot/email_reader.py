@@ -10,8 +10,10 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 import re
-from reply_generator import run_generator
+from reply_generator import run_generator, load_dataset
+from error_codes import ErrorCodeExtractor
 from email_generator import send_email
+from llm_stream import GenerationStats, stream_text
 
 SCOPES_send = ["https://www.googleapis.com/auth/gmail.send"]
 SCOPES_read= ['https://www.googleapis.com/auth/gmail.readonly']
@@ -121,15 +123,29 @@ def process_new_message(service, msg_id):
     # print("=======================================\n")
     return [sender, subject, body]
 
+_extractor = (None, None)
+
+def get_extractor():
+    """
+    ErrorCodeExtractor for the current dataset. Rebuilt whenever load_dataset
+    hot-reloads the file, so new issue_numbers are recognised without a restart.
+    """
+    global _extractor
+    try:
+        dataset = load_dataset()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if _extractor[1] is None:
+            print('Could not load issue numbers, accepting any code:', e)
+            _extractor = (None, ErrorCodeExtractor(None))
+        return _extractor[1]
+    if _extractor[0] is not dataset:
+        _extractor = (dataset, ErrorCodeExtractor(set(dataset)))
+    return _extractor[1]
+
 def error_code_getter(body):
-    pattern = r'[A-Za-z]+\s*[:\- ]\s*(\d+)'
-    match = re.search(pattern, body)
-    if match:
-        return match.group(1)
-    # for t in body:
-    #     match = re.search(pattern, t)
-    #     if match:
-    #         return match.group(1)
+    code = get_extractor().first(body)
+    if code is not None:
+        return str(code)
 
 KEYWORDS = [
     "support",
@@ -248,11 +264,16 @@ def main():
                     Body = output[2]
                     print('\nExtracting the error code from email body')
                     k = error_code_getter(Body)
+                    if k is None:
+                        print("No valid error code found. Skipping email.")
+                        continue
                     print('\nThe reply email is generating via llama3.2 8b model')
                     llm_generation = run_generator.generate_email(int(k))
+                    stats = GenerationStats()
                     mail = ''
-                    for gen in llm_generation:
+                    for gen in stream_text(llm_generation, on_chunk=lambda c: print(c, end='', flush=True), stats=stats):
                         mail = mail+gen
+                    print('\nGeneration:', stats.summary())
 
                     print('\n....Final step.....')
 
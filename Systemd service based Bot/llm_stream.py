@@ -0,0 +1,62 @@
+"""
+Shared streaming interface for LLM replies.
+
+Every backend exposes its reply as an iterator of text chunks (Gemini
+stream=True responses, Ollama stdout lines, ...). stream_text() consumes
+such an iterator, forwards chunks to a callback as they arrive and records
+time-to-first-token and total generation time.
+"""
+import time
+
+
+class GenerationStats:
+    def __init__(self):
+        self.started = None
+        self.first_token = None  # seconds until the first non-empty chunk
+        self.total = None  # seconds until the stream was exhausted
+        self.chunks = 0
+        self.chars = 0
+
+    def summary(self) -> str:
+        ttft = f"{self.first_token:.2f}s" if self.first_token is not None else "n/a"
+        total = f"{self.total:.2f}s" if self.total is not None else "n/a"
+        return f"first token {ttft}, total {total}, {self.chunks} chunks / {self.chars} chars"
+
+
+def stream_text(chunks, on_chunk=None, stats: GenerationStats = None):
+    """Yield chunks from a backend stream while timing it."""
+    stats = stats if stats is not None else GenerationStats()
+    stats.started = time.perf_counter()
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if stats.first_token is None:
+                stats.first_token = time.perf_counter() - stats.started
+            stats.chunks += 1
+            stats.chars += len(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+            yield chunk
+    finally:
+        stats.total = time.perf_counter() - stats.started
+
+
+class LineBuffer:
+    """Turns arbitrary chunk boundaries into whole lines for a log/preview sink."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.pending = ""
+
+    def __call__(self, chunk: str):
+        self.pending += chunk
+        *lines, self.pending = self.pending.split("\n")
+        for line in lines:
+            if line.strip():
+                self.sink(line)
+
+    def flush(self):
+        if self.pending.strip():
+            self.sink(self.pending)
+        self.pending = ""
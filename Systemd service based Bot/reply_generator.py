@@ -1,10 +1,39 @@
 
 
+import json
+import os
 import subprocess
 import sys
 import re
 from tqdm import tqdm
-import pandas as pd
+
+DATASET_PATH = os.getenv('DATASET_PATH', '/home/smddc/Documents/new_pro/email_classifier/possible_error.json')
+
+_dataset = {}
+
+
+def load_dataset(path = None):
+    """
+    issue_number -> record. Parsed once and again only when the file's mtime
+    changes (no per-email read_json); the new dict replaces the old one in a
+    single assignment. A half-written or invalid file keeps the previous
+    version in service until it parses.
+    """
+    path = path or DATASET_PATH
+    mtime = os.path.getmtime(path)
+    cached = _dataset.get(path)
+    if cached is None or cached[0] != mtime:
+        try:
+            with open(path, 'r', encoding = 'utf-8') as f:
+                records = {int(r['issue_number']): r for r in json.load(f)}
+        except (ValueError, KeyError, TypeError) as e:
+            if cached is None:
+                raise
+            print(f'[DATASET] {path} not loaded ({e}), keeping the previous version')
+            return cached[1]
+        cached = (mtime, records)
+        _dataset[path] = cached
+    return cached[1]
 
 class run_generator:
     @staticmethod
@@ -98,18 +127,11 @@ class run_generator:
         Uday Hiremath
         AI Expert
         '''
-        data = pd.read_json('/home/smddc/Documents/new_pro/email_classifier/possible_error.json')
-
-        issue_num = None
-        issue = None
-        solution = None
-
+        record = load_dataset().get(issue_value, {})
 
-        for i in zip(data['issue_number'], data['issue'], data['solution']):
-            if i[0] == issue_value:
-                issue_num = i[0]
-                issue = i[1]
-                solution = i[2]
+        issue_num = record.get('issue_number')
+        issue = record.get('issue')
+        solution = record.get('solution')
         
         prompt = f"Consider yourself as tech supporter, here is possible issue number{issue_num}, issue {issue} and solution {solution}.Consider the inputs and generate the final ouput as clean email , mention issue number, issue and solution(descriptive), generate in 100 words, here is templeate{template}"
         